@@ -1,414 +1,3280 @@
 import gradio as gr
 import json
 import numpy as np
-from transformers import pipeline, AutoTokenizer, AutoModel
-import torch
 import os
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator, Callable
 import time
 import requests
 import re
 import math
-from collections import defaultdict, Counter
+import sys
+import hashlib
+import zlib
+import functools
+import contextlib
+import contextvars
+import copy
+import threading
+import multiprocessing
+import queue
+import asyncio
+from collections import defaultdict, Counter, OrderedDict, deque
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future
 
-# Configure device
-device = "cuda" if torch.cuda.is_available() else "cpu"
-print(f"Using device: {device}")
+try:
+    from scipy import sparse  # optional, enables batch BM25 scoring
+except ImportError:
+    sparse = None
+
+# Fast start: serve BM25 immediately and load torch, the model and embeddings in the background
+FAST_START = os.environ.get("RAG_FAST_START", "0") == "1"
+
+# Embedding configuration
+EMBEDDING_MODEL_NAME = os.environ.get("RAG_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+EMBEDDING_DIM = 384
+EMBEDDING_BATCH_SIZE = int(os.environ.get("RAG_EMBEDDING_BATCH_SIZE", "32"))
+EMBEDDING_WORKERS = int(os.environ.get("RAG_EMBEDDING_WORKERS", "1"))
+MAX_SEQ_LENGTH = 256  # all-MiniLM-L6-v2 was trained with 256 word pieces
+
+# Inference backend: "torch", "onnx" (ONNX Runtime), "onnx-int8" (ONNX Runtime, dynamic int8 weights)
+# or "stub" (hashed bag-of-words vectors, no model download; for benchmarks only)
+INFERENCE_BACKEND = os.environ.get("RAG_INFERENCE_BACKEND", "torch")
+ONNX_MODEL_DIR = os.environ.get("RAG_ONNX_MODEL_DIR", ".onnx_models")
+INTRA_OP_THREADS = int(os.environ.get("RAG_INTRA_OP_THREADS", "0"))  # 0 keeps the runtime default
+INTER_OP_THREADS = int(os.environ.get("RAG_INTER_OP_THREADS", "0"))
+ONNX_MAX_DRIFT = float(os.environ.get("RAG_ONNX_MAX_DRIFT", "0.02"))  # max 1 - cosine vs PyTorch before falling back
+
+# Chunking: sections longer than the token budget are split into overlapping chunks
+CHUNK_MAX_TOKENS = int(os.environ.get("RAG_CHUNK_MAX_TOKENS", "0"))  # 0 uses the model's max_seq_length
+CHUNK_OVERLAP_TOKENS = int(os.environ.get("RAG_CHUNK_OVERLAP_TOKENS", "32"))
+
+# Embedding cache configuration (set RAG_EMBEDDING_CACHE_DIR="" to disable)
+EMBEDDING_CACHE_DIR = os.environ.get("RAG_EMBEDDING_CACHE_DIR", ".embedding_cache")
+EMBEDDING_CACHE_MAX_AGE = float(os.environ.get("RAG_EMBEDDING_CACHE_MAX_AGE", str(7 * 24 * 3600)))  # seconds
+
+# Query cache configuration
+QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get("RAG_QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+RESULT_CACHE_SIZE = int(os.environ.get("RAG_RESULT_CACHE_SIZE", "512"))
+RESULT_CACHE_TTL = float(os.environ.get("RAG_RESULT_CACHE_TTL", "300"))  # seconds
+
+# Query micro-batching (set RAG_BATCH_WINDOW_MS=0 to embed every query on its own); the window caps how
+# long a batch keeps taking queued requests, a lone request never waits for it
+BATCH_WINDOW_MS = float(os.environ.get("RAG_BATCH_WINDOW_MS", "5"))
+BATCH_MAX_SIZE = int(os.environ.get("RAG_BATCH_MAX_SIZE", "32"))
+BATCH_QUEUE_SIZE = int(os.environ.get("RAG_BATCH_QUEUE_SIZE", "256"))
+BATCH_SUBMIT_TIMEOUT = float(os.environ.get("RAG_BATCH_SUBMIT_TIMEOUT", "10"))  # seconds
+
+# Knowledge base sources; set RAG_WATCH_INTERVAL (seconds) to reload them when they change
+MARKDOWN_FILES = [
+    'about.md',
+    'research_details.md',
+    'publications_detailed.md',
+    'skills_expertise.md',
+    'experience_detailed.md',
+    'statistics.md'
+]
+WATCH_INTERVAL = float(os.environ.get("RAG_WATCH_INTERVAL", "0"))
+MARKDOWN_DIRS = [path for path in os.environ.get("RAG_MARKDOWN_DIRS", "").split(os.pathsep) if path]  # searched recursively
+
+# Processes that parse and tokenize markdown files during a full index build (1 builds serially)
+BUILD_WORKERS = int(os.environ.get("RAG_BUILD_WORKERS", "1"))
+
+# Prebuilt index artifact (see --build-index); used instead of the markdown files when present
+INDEX_ARTIFACT = os.environ.get("RAG_INDEX_ARTIFACT", "")
+
+# Multi-process serving: the primary builds the index and publishes generation-numbered artifacts in
+# RAG_SHARED_INDEX_DIR (tmpfs such as /dev/shm keeps them in RAM); workers memory-map the current one
+SHARED_INDEX_DIR = os.environ.get("RAG_SHARED_INDEX_DIR", "")
+SERVING_ROLE = os.environ.get("RAG_SERVING_ROLE", "primary")  # "primary" or "worker"
+GENERATION_POLL_INTERVAL = float(os.environ.get("RAG_GENERATION_POLL_INTERVAL", "2"))  # seconds
+SHARED_INDEX_TIMEOUT = float(os.environ.get("RAG_SHARED_INDEX_TIMEOUT", "600"))  # worker wait for the first generation
+SERVER_PORT = int(os.environ.get("RAG_SERVER_PORT", "7860"))  # workers started by --workers use the next ports
+
+# Embedding storage: "float32" keeps the matrix in memory; "float16" or "int8" keep a compressed
+# copy in memory and memory-map the full-precision matrix for re-ranking
+EMBEDDING_STORAGE = os.environ.get("RAG_EMBEDDING_STORAGE", "float32")
+QUANTIZATION = EMBEDDING_STORAGE if EMBEDDING_STORAGE in ("float16", "int8") else "int8"
+RERANK_FACTOR = int(os.environ.get("RAG_RERANK_FACTOR", "4"))  # candidates re-ranked per requested result
+RECALL_SAMPLE_ROWS = int(os.environ.get("RAG_RECALL_SAMPLE_ROWS", "10000"))  # rows the quantized recall check searches
+
+# Vector index configuration: "exact" brute force, "ivf" approximate or "quantized" compressed search
+VECTOR_BACKEND = os.environ.get("RAG_VECTOR_BACKEND", "exact" if EMBEDDING_STORAGE == "float32" else "quantized")
+IVF_NLIST = int(os.environ.get("RAG_IVF_NLIST", "0"))  # 0 picks sqrt(N) lists
+IVF_NPROBE = int(os.environ.get("RAG_IVF_NPROBE", "8"))
+FILTER_GATHER_DENSITY = float(os.environ.get("RAG_FILTER_GATHER_DENSITY", "0.25"))  # filters matching fewer rows gather them
+VECTOR_INDEX_DIR = os.environ.get("RAG_VECTOR_INDEX_DIR", EMBEDDING_CACHE_DIR)
+
+# BM25 configuration
+BM25_MAX_SCORE = os.environ.get("RAG_BM25_MAX_SCORE", "0") == "1"
+BM25_STEMMING = os.environ.get("RAG_BM25_STEMMING", "0") == "1"  # light plural stemming of BM25 terms
+
+# Hybrid search: run both retrievers concurrently and fuse with "weighted", "rrf" or "zscore"
+PARALLEL_RETRIEVAL = os.environ.get("RAG_PARALLEL_RETRIEVAL", "1") == "1"
+RETRIEVER_WORKERS = int(os.environ.get("RAG_RETRIEVER_WORKERS", "4"))
+FUSION_MODE = os.environ.get("RAG_FUSION_MODE", "weighted")
+RRF_K = int(os.environ.get("RAG_RRF_K", "60"))
+
+# Latency metrics: histogram buckets (seconds) and recent samples kept per histogram for percentiles
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_WINDOW = int(os.environ.get("RAG_METRICS_WINDOW", "1024"))
+
+class EmbeddingCache:
+    """Content-addressed on-disk store of section embeddings.
+    
+    Vectors live in a memory-mapped ``embeddings-<id>.npy`` and a JSON
+    sidecar ``index.json`` names that file and maps each content key to its
+    row and last-used time. A rewrite creates a new matrix file before
+    atomically replacing the sidecar, so a reader never pairs a matrix with
+    another matrix's row map.
+    """
+    
+    VERSION = 2
+    
+    def __init__(self, cache_dir: str, dim: int = EMBEDDING_DIM, max_age: float = EMBEDDING_CACHE_MAX_AGE):
+        self.cache_dir = cache_dir
+        self.dim = dim
+        self.max_age = max_age
+        self.matrix_name = None  # matrix file named by index.json
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.entries = {}  # key -> {"row": int, "last_used": float}
+        self.matrix = np.zeros((0, dim), dtype=np.float32)
+        self.load()
+    
+    @staticmethod
+    def make_key(model_name: str, text: str, pooling_config: str) -> str:
+        """Hash (model, text, pooling) into a cache key"""
+        digest = hashlib.sha256()
+        for part in (model_name, pooling_config, text):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+    
+    def load(self):
+        """Open the cache files, starting empty if they are missing or unreadable"""
+        self.entries = {}
+        self.matrix = np.zeros((0, self.dim), dtype=np.float32)
+        self.matrix_name = None
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            if index.get("version") != self.VERSION or index.get("dim") != self.dim:
+                print("⚠️ Embedding cache format mismatch, ignoring it")
+                return
+            matrix = np.load(os.path.join(self.cache_dir, index["matrix"]), mmap_mode="r")
+            if matrix.shape[1:] != (self.dim,):
+                print("⚠️ Embedding cache format mismatch, ignoring it")
+                return
+            self.entries = index["entries"]
+            self.matrix = matrix
+            self.matrix_name = index["matrix"]
+        except Exception as e:
+            print(f"⚠️ Could not read embedding cache: {e}")
+    
+    def lookup(self, keys: List[str]):
+        """Return a (len(keys), dim) matrix filled from the cache and the positions that missed"""
+        matrix = np.zeros((len(keys), self.dim), dtype=np.float32)
+        positions, rows, missing = [], [], []
+        for i, key in enumerate(keys):
+            entry = self.entries.get(key)
+            if entry is not None and entry["row"] < len(self.matrix):
+                positions.append(i)
+                rows.append(entry["row"])
+            else:
+                missing.append(i)
+        if rows:
+            matrix[positions] = self.matrix[rows]
+        return matrix, missing
+    
+    def update(self, keys: List[str], matrix: np.ndarray, live_keys: Iterable[str] = ()):
+        """Store vectors for ``keys``, evict entries unused for ``max_age`` and persist if anything changed.
+        
+        ``live_keys`` are sections still in the corpus but not in this update
+        (e.g. the unchanged sections of a reload); they count as used now.
+        """
+        now = time.time()
+        changed = False
+        keys_used = set(keys) | set(live_keys)
+        
+        # Keep fresh or live entries that are not part of this update
+        kept = {}
+        for key, entry in self.entries.items():
+            if key in keys_used or now - entry["last_used"] <= self.max_age:
+                kept[key] = entry
+            else:
+                changed = True
+        
+        new_rows = {}
+        for i, key in enumerate(keys):
+            if key in kept or key in new_rows:
+                continue
+            # Zero rows come from failed batches and must not be cached
+            if not matrix[i].any():
+                continue
+            new_rows[key] = i
+            changed = True
+        
+        if not changed:
+            # Only refresh timestamps, the matrix file stays as it is
+            for key in keys_used & kept.keys():
+                kept[key]["last_used"] = now
+            if self.matrix_name is not None:
+                self._write_index(kept, self.matrix_name)
+            self.entries = kept
+            return
+        
+        old_keys = list(kept.keys())
+        compacted = np.empty((len(old_keys) + len(new_rows), self.dim), dtype=np.float32)
+        if old_keys:
+            compacted[:len(old_keys)] = self.matrix[[kept[key]["row"] for key in old_keys]]
+        if new_rows:
+            compacted[len(old_keys):] = matrix[list(new_rows.values())]
+        
+        entries = {}
+        for row, key in enumerate(old_keys + list(new_rows.keys())):
+            last_used = now if key in keys_used else kept[key]["last_used"]
+            entries[key] = {"row": row, "last_used": last_used}
+        
+        # A new matrix file, published by the sidecar that names it
+        os.makedirs(self.cache_dir, exist_ok=True)
+        matrix_name = f"embeddings-{int(now * 1000)}-{os.getpid()}.npy"
+        tmp_path = os.path.join(self.cache_dir, matrix_name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, compacted)
+        os.replace(tmp_path, os.path.join(self.cache_dir, matrix_name))
+        self._write_index(entries, matrix_name)
+        
+        # Keep the matrix just replaced for replicas that read the previous sidecar; open maps survive unlink
+        previous = self.matrix_name
+        self.entries = entries
+        self.matrix = np.load(os.path.join(self.cache_dir, matrix_name), mmap_mode="r")
+        self.matrix_name = matrix_name
+        for filename in self.matrix_files():
+            if filename not in (matrix_name, previous):
+                try:
+                    os.remove(os.path.join(self.cache_dir, filename))
+                except OSError:
+                    pass
+    
+    def matrix_files(self) -> List[str]:
+        return [filename for filename in os.listdir(self.cache_dir)
+                if filename.startswith("embeddings") and filename.endswith(".npy")]
+    
+    def _write_index(self, entries: Dict[str, Dict[str, float]], matrix_name: str):
+        """Atomically write the sidecar index"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": self.VERSION, "dim": self.dim, "matrix": matrix_name, "entries": entries}, f)
+        os.replace(tmp_path, self.index_path)
+    
+    def clear(self):
+        """Remove every cached embedding"""
+        if os.path.exists(self.index_path):
+            os.remove(self.index_path)
+        if os.path.isdir(self.cache_dir):
+            for filename in self.matrix_files():
+                os.remove(os.path.join(self.cache_dir, filename))
+        self.entries = {}
+        self.matrix = np.zeros((0, self.dim), dtype=np.float32)
+        self.matrix_name = None
+    
+    def __len__(self):
+        return len(self.entries)
+
+class LRUCache:
+    """Thread-safe LRU cache with optional TTL and hit/miss/eviction counters"""
+    
+    def __init__(self, max_size: int, ttl: float = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (stored_at, value)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+    
+    def get(self, key):
+        """Return the cached value or None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_at, value = entry
+            if self.ttl is not None and time.time() - stored_at > self.ttl:
+                del self.entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def put(self, key, value):
+        """Store a value, evicting the least recently used entries beyond max_size"""
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (time.time(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+    
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+class LatencyHistogram:
+    """Latency histogram with cumulative Prometheus buckets and a rolling window for percentiles"""
+    
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS, window: int = METRICS_WINDOW):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)  # observations <= each bound, not yet cumulative
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=max(1, window))
+        self.lock = threading.Lock()
+    
+    def observe(self, seconds: float):
+        with self.lock:
+            self.count += 1
+            self.sum += seconds
+            self.recent.append(seconds)
+            for position, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    self.counts[position] += 1
+                    break
+    
+    def stats(self) -> Dict[str, Any]:
+        """Lifetime count and mean, percentiles over the recent window, in milliseconds"""
+        with self.lock:
+            recent = np.array(self.recent) * 1000
+            count, total = self.count, self.sum
+        if count == 0:
+            return {"count": 0}
+        p50, p95, p99 = np.percentile(recent, [50, 95, 99])
+        return {
+            "count": count,
+            "mean_ms": total / count * 1000,
+            "p50_ms": float(p50),
+            "p95_ms": float(p95),
+            "p99_ms": float(p99),
+            "last_ms": float(recent[-1]),
+            "window": len(recent)
+        }
+    
+    def prometheus_lines(self, name: str, labels: str) -> List[str]:
+        with self.lock:
+            counts, count, total = list(self.counts), self.count, self.sum
+        separator = "," if labels else ""
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{{{labels}{separator}le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels}{separator}le="+Inf"}} {count}')
+        lines.append(f"{name}_sum{{{labels}}} {total}")
+        lines.append(f"{name}_count{{{labels}}} {count}")
+        return lines
+
+class Metrics:
+    """Process-wide latency histograms and counters for the search and chat hot paths.
+    
+    ``stage`` times one step of a search. Inside ``trace`` the stage times
+    are also summed into a per-request breakdown; the trace lives in a
+    context variable, so work handed to the retriever pool reports into it
+    when submitted through ``contextvars.copy_context().run``.
+    """
+    
+    HELP = {
+        "rag_request_duration_seconds": "End-to-end latency of API endpoints",
+        "rag_stage_duration_seconds": "Latency of individual search stages",
+        "rag_errors_total": "Errors caught on the search and chat paths",
+        "rag_fallbacks_total": "Searches served by a degraded path"
+    }
+    
+    def __init__(self):
+        self.histograms = {}  # (name, labels) -> LatencyHistogram
+        self.counters = defaultdict(int)  # (name, labels) -> count
+        self.lock = threading.Lock()
+        self.current_trace = contextvars.ContextVar("rag_trace", default=None)
+    
+    def histogram(self, name: str, **labels) -> LatencyHistogram:
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(key, LatencyHistogram())
+        return histogram
+    
+    def observe(self, name: str, seconds: float, **labels):
+        self.histogram(name, **labels).observe(seconds)
+    
+    def increment(self, name: str, amount: int = 1, **labels):
+        with self.lock:
+            self.counters[(name, tuple(sorted(labels.items())))] += amount
+    
+    @contextlib.contextmanager
+    def stage(self, stage: str):
+        """Time a search stage into its histogram and the active trace, if any"""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start_time
+            self.observe("rag_stage_duration_seconds", elapsed, stage=stage)
+            trace = self.current_trace.get()
+            if trace is not None:
+                trace[stage] = trace.get(stage, 0.0) + elapsed * 1000
+    
+    @contextlib.contextmanager
+    def trace(self):
+        """Collect a stage -> milliseconds breakdown of the work done inside the block"""
+        trace = {}
+        token = self.current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            self.current_trace.reset(token)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Histograms and counters grouped by metric name and label values"""
+        with self.lock:
+            histograms = list(self.histograms.items())
+            counters = list(self.counters.items())
+        result = {"histograms": defaultdict(dict), "counters": defaultdict(dict)}
+        for (name, labels), histogram in histograms:
+            result["histograms"][name][",".join(value for _, value in labels) or "all"] = histogram.stats()
+        for (name, labels), count in counters:
+            result["counters"][name][",".join(value for _, value in labels) or "all"] = count
+        return {kind: dict(values) for kind, values in result.items()}
+    
+    def prometheus_text(self, gauges: Dict[str, float] = None) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+        
+        def format_labels(labels: tuple) -> str:
+            return ",".join(f'{key}="{value}"' for key, value in labels)
+        
+        lines = []
+        declared = set()
+        for (name, labels), histogram in histograms:
+            if name not in declared:
+                declared.add(name)
+                lines += [f"# HELP {name} {self.HELP.get(name, name)}", f"# TYPE {name} histogram"]
+            lines += histogram.prometheus_lines(name, format_labels(labels))
+        for (name, labels), count in counters:
+            if name not in declared:
+                declared.add(name)
+                lines += [f"# HELP {name} {self.HELP.get(name, name)}", f"# TYPE {name} counter"]
+            lines.append(f"{name}{{{format_labels(labels)}}} {count}")
+        for name, value in (gauges or {}).items():
+            lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+class EmbeddingBatcher:
+    """Collects concurrent query embedding requests into small batches.
+    
+    A single worker thread waits for the first request, then takes whatever
+    else is already queued (requests that arrived during the previous
+    forward pass) until the queue is empty, ``max_batch_size`` is reached or
+    ``window_ms`` has passed. It never waits on an empty queue, so a lone
+    request is embedded immediately. Each batch is embedded with one call and
+    resolves each caller's future. The queue is bounded: when it is full,
+    submitters block and eventually time out.
+    """
+    
+    def __init__(self, embed_fn, window_ms: float = BATCH_WINDOW_MS, max_batch_size: int = BATCH_MAX_SIZE,
+                 queue_size: int = BATCH_QUEUE_SIZE, submit_timeout: float = BATCH_SUBMIT_TIMEOUT):
+        self.embed_fn = embed_fn  # List[str] -> (len, dim) float32 matrix
+        self.window = window_ms / 1000
+        self.max_batch_size = max(1, max_batch_size)
+        self.submit_timeout = submit_timeout
+        self.requests = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+        self.rejected = 0
+        self.worker = threading.Thread(target=self.run, name="embedding-batcher", daemon=True)
+        self.worker.start()
+    
+    def submit(self, text: str) -> Future:
+        """Queue a text and return a future resolving to its embedding"""
+        future = Future()
+        try:
+            self.requests.put((text, future), timeout=self.submit_timeout)
+        except queue.Full:
+            with self.lock:
+                self.rejected += 1
+            raise TimeoutError("Embedding queue is full, try again later")
+        return future
+    
+    def embed(self, text: str) -> np.ndarray:
+        """Blocking helper for synchronous callers"""
+        return self.submit(text).result()
+    
+    async def embed_async(self, text: str) -> np.ndarray:
+        """Awaitable helper for asyncio callers"""
+        return await asyncio.wrap_future(self.submit(text))
+    
+    def run(self):
+        while True:
+            batch = [self.requests.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch_size and time.monotonic() < deadline:
+                try:
+                    batch.append(self.requests.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.process(batch)
+            except Exception as e:
+                # This thread serves every caller; one bad batch must not stop it
+                print(f"❌ Error in embedding batcher: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+    
+    def process(self, batch: List[tuple]):
+        # Callers that gave up (e.g. a cancelled embed_async) are dropped; the rest can no longer be cancelled
+        batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        # Identical texts in one window share a row
+        unique_texts = list(dict.fromkeys(text for text, _ in batch))
+        try:
+            matrix = self.embed_fn(unique_texts)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        
+        rows = {text: row for row, text in enumerate(unique_texts)}
+        for text, future in batch:
+            future.set_result(matrix[rows[text]])
+        
+        with self.lock:
+            self.batches += 1
+            self.items += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+    
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "window_ms": self.window * 1000,
+                "max_batch_size": self.max_batch_size,
+                "queue_depth": self.requests.qsize(),
+                "queue_capacity": self.requests.maxsize,
+                "batches": self.batches,
+                "queries": self.items,
+                "average_batch_size": self.items / self.batches if self.batches else 0.0,
+                "largest_batch": self.largest_batch,
+                "rejected": self.rejected
+            }
+
+class OnnxEncoder:
+    """Transformer encoder exported to ONNX and run with ONNX Runtime on CPU.
+    
+    The PyTorch model is exported once per model name and cached on disk;
+    ``quantize`` adds a dynamically quantised (int8 weights) copy.
+    """
+    
+    INPUT_NAMES = ["input_ids", "attention_mask", "token_type_ids"]
+    
+    def __init__(self, path: str, intra_op_threads: int = INTRA_OP_THREADS, inter_op_threads: int = INTER_OP_THREADS):
+        import onnxruntime
+        
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads > 0:
+            options.intra_op_num_threads = intra_op_threads
+        if inter_op_threads > 0:
+            options.inter_op_num_threads = inter_op_threads
+        self.path = path
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {node.name for node in self.session.get_inputs()}
+    
+    @classmethod
+    def export(cls, model, tokenizer, model_name: str, quantize: bool = False, model_dir: str = ONNX_MODEL_DIR) -> str:
+        """Path of the exported (and optionally quantised) model, exporting it on first use"""
+        import torch
+        
+        os.makedirs(model_dir, exist_ok=True)
+        stem = os.path.join(model_dir, hashlib.sha256(model_name.encode("utf-8")).hexdigest()[:16])
+        fp32_path, int8_path = stem + ".onnx", stem + ".int8.onnx"
+        
+        if not os.path.exists(fp32_path):
+            print(f"Exporting {model_name} to ONNX...")
+            
+            class Encoder(torch.nn.Module):
+                # Positional inputs and a single tensor output, whatever the model's forward() signature
+                def __init__(self):
+                    super().__init__()
+                    self.model = model
+                
+                def forward(self, input_ids, attention_mask, token_type_ids):
+                    return self.model(input_ids=input_ids, attention_mask=attention_mask,
+                                      token_type_ids=token_type_ids).last_hidden_state
+            
+            sample = tokenizer(["export sample"], return_tensors="pt")
+            inputs = tuple(sample[name] if name in sample else torch.zeros_like(sample["input_ids"])
+                           for name in cls.INPUT_NAMES)
+            axes = {0: "batch", 1: "sequence"}
+            tmp_path = fp32_path + ".tmp"
+            torch.onnx.export(
+                Encoder().eval(), inputs, tmp_path,
+                input_names=cls.INPUT_NAMES,
+                output_names=["last_hidden_state"],
+                dynamic_axes={name: axes for name in cls.INPUT_NAMES + ["last_hidden_state"]},
+                opset_version=14,
+                dynamo=False
+            )
+            os.replace(tmp_path, fp32_path)
+        
+        if not quantize:
+            return fp32_path
+        if not os.path.exists(int8_path):
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            print("Quantising ONNX model weights to int8...")
+            tmp_path = int8_path + ".tmp"
+            quantize_dynamic(fp32_path, tmp_path, weight_type=QuantType.QInt8)
+            os.replace(tmp_path, int8_path)
+        return int8_path
+    
+    def __call__(self, encoded: Dict[str, np.ndarray]) -> np.ndarray:
+        """last_hidden_state for a tokenizer batch of int64 numpy arrays"""
+        feed = {name: encoded[name] if name in encoded else np.zeros_like(encoded["input_ids"])
+                for name in self.INPUT_NAMES if name in self.input_names}
+        return self.session.run(["last_hidden_state"], feed)[0]
+
+class StubEncoder:
+    """Model-free stand-in for the embedding model.
+    
+    Words are hashed into signed buckets of an EMBEDDING_DIM vector, so texts
+    sharing words get similar vectors. Search quality is meaningless, but
+    the index, retrieval and fusion code paths do the same work as with
+    the real model.
+    """
+    
+    TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+    
+    @staticmethod
+    def count_tokens(text: str) -> int:
+        """Approximate word-piece count: words and punctuation marks"""
+        return len(StubEncoder.TOKEN_PATTERN.findall(text))
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=65536)
+    def bucket(word: str) -> (int, float):
+        code = zlib.crc32(word.encode("utf-8"))
+        return code % EMBEDDING_DIM, 1.0 if code & 0x10000 else -1.0
+    
+    @classmethod
+    def embed(cls, texts: List[str]) -> np.ndarray:
+        """L2-normalised float32 vectors, deterministic across processes"""
+        matrix = np.zeros((len(texts), EMBEDDING_DIM), dtype=np.float32)
+        for row, text in enumerate(texts):
+            buckets = [cls.bucket(word) for word in TextAnalyzer.WORD_PATTERN.findall(text.lower())]
+            if buckets:
+                positions, signs = zip(*buckets)
+                matrix[row] = np.bincount(positions, weights=signs, minlength=EMBEDDING_DIM)
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        return matrix
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Indices of the top_k highest scores, best first, without a full sort"""
+    if top_k <= 0 or len(scores) == 0:
+        return np.zeros(0, dtype=np.int64)
+    if top_k < len(scores):
+        # Ties at the cut-off go to the earliest documents, like a stable full sort
+        kth_score = np.partition(scores, len(scores) - top_k)[len(scores) - top_k]
+        above = np.flatnonzero(scores > kth_score)
+        tied = np.flatnonzero(scores == kth_score)[:top_k - len(above)]
+        candidates = np.sort(np.concatenate([above, tied]))
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+FUSION_MODES = ("weighted", "rrf", "zscore")
+
+def normalize_ranking(scores: np.ndarray, mode: str) -> np.ndarray:
+    """Per-retriever fusion score of a ranked score array (best first)"""
+    scores = np.asarray(scores, dtype=np.float64)
+    if len(scores) == 0:
+        return scores
+    if mode == "weighted":
+        # Max-normalised to [0, 1]
+        top = scores.max()
+        return scores / top if top > 0 else np.zeros_like(scores)
+    if mode == "rrf":
+        # Reciprocal rank fusion ignores score scales altogether
+        return 1.0 / (RRF_K + np.arange(1, len(scores) + 1))
+    if mode == "zscore":
+        std = scores.std()
+        return (scores - scores.mean()) / std if std > 0 else np.zeros_like(scores)
+    raise ValueError(f"Unknown fusion mode '{mode}', expected one of {FUSION_MODES}")
+
+def fuse_rankings(vector_ids: np.ndarray, vector_scores: np.ndarray, bm25_ids: np.ndarray, bm25_scores: np.ndarray,
+                  top_k: int, vector_weight: float, bm25_weight: float, mode: str = "weighted"):
+    """Fuse two ranked candidate id arrays into the top_k hybrid ranking.
+    
+    Returns (doc ids, fused scores, vector components, bm25 components,
+    found-by mask (1 vector, 2 bm25, 3 both)), all ordered best first.
+    A document missing from one ranking gets that ranking's floor: 0 for
+    weighted and rrf, the lowest retrieved z-score for zscore.
+    """
+    vector_ids = np.asarray(vector_ids, dtype=np.int64)
+    bm25_ids = np.asarray(bm25_ids, dtype=np.int64)
+    vector_norm = normalize_ranking(vector_scores, mode)
+    bm25_norm = normalize_ranking(bm25_scores, mode)
+    
+    # Vector hits first, then BM25-only hits, so equal scores keep retrieval order
+    bm25_only = ~np.isin(bm25_ids, vector_ids)
+    ids = np.concatenate([vector_ids, bm25_ids[bm25_only]])
+    found = np.zeros(len(ids), dtype=np.int8)
+    found[:len(vector_ids)] = 1
+    
+    vector_part = np.full(len(ids), vector_norm.min() if mode == "zscore" and len(vector_norm) else 0.0)
+    bm25_part = np.full(len(ids), bm25_norm.min() if mode == "zscore" and len(bm25_norm) else 0.0)
+    vector_part[:len(vector_ids)] = vector_norm
+    if len(bm25_ids):
+        sorter = np.argsort(ids, kind="stable")
+        positions = sorter[np.searchsorted(ids, bm25_ids, sorter=sorter)]
+        bm25_part[positions] = bm25_norm
+        found[positions] |= 2
+    
+    fused = vector_weight * vector_part + bm25_weight * bm25_part
+    winners = top_k_indices(fused, top_k)
+    return ids[winners], fused[winners], vector_part[winners], bm25_part[winners], found[winners]
+
+class ExactVectorIndex:
+    """Brute-force cosine search over the whole L2-normalised embedding matrix"""
+    
+    name = "exact"
+    
+    def __init__(self, embeddings: np.ndarray):
+        self.embeddings = embeddings
+    
+    def search(self, query_vector: np.ndarray, top_k: int, boost: np.ndarray,
+               allowed: np.ndarray = None) -> (np.ndarray, np.ndarray):
+        """Return the top_k row indices and their boosted cosine scores, only scoring ``allowed`` rows if given"""
+        if allowed is not None:
+            rows = np.flatnonzero(allowed)
+            if len(rows) < FILTER_GATHER_DENSITY * len(allowed):
+                # Selective filter: copying the few allowed rows is cheaper than scoring them all
+                scores = (self.embeddings[rows] @ query_vector) * boost[rows]
+                winners = top_k_indices(scores, top_k)
+                return rows[winners], scores[winners]
+            top_k = min(top_k, len(rows))
+        # Rows and query are L2-normalised, so one matrix-vector product gives every cosine similarity
+        scores = (self.embeddings @ query_vector) * boost
+        if allowed is not None:
+            scores[~allowed] = -np.inf
+        winners = top_k_indices(scores, top_k)
+        return winners, scores[winners]
+    
+    def remap(self, embeddings: np.ndarray, old_to_new: np.ndarray, added: List[int]) -> 'ExactVectorIndex':
+        return ExactVectorIndex(embeddings)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "vectors": len(self.embeddings)}
+
+class IVFVectorIndex:
+    """Inverted-file ANN index with a spherical k-means coarse quantiser.
+    
+    Vectors are assigned to the nearest of ``nlist`` centroids; a query only
+    scores the vectors in its ``nprobe`` closest lists. Raising ``nprobe``
+    trades latency for recall (``nprobe == nlist`` is exact search).
+    """
+    
+    name = "ivf"
+    VERSION = 1
+    
+    def __init__(self, embeddings: np.ndarray, centroids: np.ndarray, assignments: np.ndarray, nprobe: int = IVF_NPROBE,
+                 list_ids: np.ndarray = None, list_offsets: np.ndarray = None):
+        self.embeddings = embeddings
+        self.centroids = centroids
+        self.assignments = assignments  # row -> list id
+        self.nprobe = nprobe
+        # CSR-style inverted lists: rows of list l are list_ids[list_offsets[l]:list_offsets[l + 1]]
+        if list_ids is None:
+            list_ids = np.argsort(assignments, kind="stable").astype(np.int64)
+            list_offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+            list_offsets[1:] = np.cumsum(np.bincount(assignments, minlength=len(centroids)))
+        self.list_ids = list_ids
+        self.list_offsets = list_offsets
+    
+    @classmethod
+    def build(cls, embeddings: np.ndarray, nlist: int = None, nprobe: int = IVF_NPROBE, iterations: int = 10,
+              seed: int = 0) -> 'IVFVectorIndex':
+        """Train the coarse quantiser on the embeddings and assign every row"""
+        n = len(embeddings)
+        nlist = max(1, min(nlist or int(math.sqrt(n)) or 1, n or 1))
+        rng = np.random.default_rng(seed)
+        
+        # Train on a bounded sample, like most IVF implementations
+        sample = embeddings[rng.choice(n, size=min(n, 256 * nlist), replace=False)] if n else embeddings
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy() if n else \
+            np.zeros((1, embeddings.shape[1]), dtype=np.float32)
+        for _ in range(iterations if n else 0):
+            labels = cls.assign(sample, centroids)
+            for list_id in range(nlist):
+                members = sample[labels == list_id]
+                if len(members):
+                    centroids[list_id] = members.mean(axis=0)
+            centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+        
+        return cls(embeddings, centroids.astype(np.float32), cls.assign(embeddings, centroids), nprobe)
+    
+    @staticmethod
+    def assign(vectors: np.ndarray, centroids: np.ndarray, chunk_size: int = 16384) -> np.ndarray:
+        """Nearest centroid of every vector, in chunks to bound memory"""
+        labels = np.zeros(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), chunk_size):
+            labels[start:start + chunk_size] = np.argmax(vectors[start:start + chunk_size] @ centroids.T, axis=1)
+        return labels
+    
+    def search(self, query_vector: np.ndarray, top_k: int, boost: np.ndarray,
+               allowed: np.ndarray = None) -> (np.ndarray, np.ndarray):
+        """Return the top_k row indices among the probed lists and their boosted cosine scores.
+        
+        With a filter, the probe is widened until it holds top_k allowed rows
+        (or every allowed row), so selective filters do not shorten the results.
+        """
+        centroid_scores = self.centroids @ query_vector
+        wanted = min(top_k, int(np.count_nonzero(allowed))) if allowed is not None else 0
+        nprobe = self.nprobe
+        while True:
+            probe = top_k_indices(centroid_scores, nprobe)
+            candidates = np.sort(np.concatenate(
+                [self.list_ids[self.list_offsets[l]:self.list_offsets[l + 1]] for l in probe]
+            )) if len(probe) else np.zeros(0, dtype=np.int64)
+            if allowed is not None:
+                candidates = candidates[allowed[candidates]]
+            if len(candidates) >= wanted or nprobe >= len(self.centroids):
+                break
+            nprobe *= 2
+        scores = (self.embeddings[candidates] @ query_vector) * boost[candidates]
+        winners = top_k_indices(scores, top_k)
+        return candidates[winners], scores[winners]
+    
+    def remap(self, embeddings: np.ndarray, old_to_new: np.ndarray, added: List[int]) -> 'IVFVectorIndex':
+        """Carry list assignments over to a reloaded snapshot and insert its new rows"""
+        assignments = np.zeros(len(embeddings), dtype=np.int64)
+        kept = np.flatnonzero(old_to_new >= 0)
+        assignments[old_to_new[kept]] = self.assignments[kept]
+        if len(added):
+            assignments[added] = self.assign(embeddings[added], self.centroids)
+        return IVFVectorIndex(embeddings, self.centroids, assignments, self.nprobe)
+    
+    @staticmethod
+    def fingerprint(embeddings: np.ndarray) -> str:
+        # Hash the buffer in place; tobytes() would copy a mapped matrix into private memory
+        return hashlib.sha256(np.ascontiguousarray(embeddings).data).hexdigest()
+    
+    def artifact_sections(self) -> (Dict[str, Any], Dict[str, np.ndarray]):
+        """Parameters and arrays stored in an index artifact (see IndexArtifact)"""
+        return {}, {"centroids": self.centroids, "assignments": self.assignments,
+                    "list_ids": self.list_ids, "list_offsets": self.list_offsets}
+    
+    @classmethod
+    def from_artifact_sections(cls, embeddings: np.ndarray, params: Dict[str, Any],
+                               arrays: Dict[str, np.ndarray]) -> 'IVFVectorIndex':
+        return cls(embeddings, arrays["centroids"], arrays["assignments"], IVF_NPROBE,
+                   arrays["list_ids"], arrays["list_offsets"])
+    
+    def save(self, path: str):
+        """Persist centroids and assignments; vectors stay with the snapshot"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, version=self.VERSION, fingerprint=self.fingerprint(self.embeddings),
+                 centroids=self.centroids, assignments=self.assignments)
+        os.replace(tmp_path, path)
+    
+    @classmethod
+    def load(cls, path: str, embeddings: np.ndarray, nprobe: int = IVF_NPROBE) -> 'IVFVectorIndex':
+        """Load a saved index, or return None if it was built for different embeddings"""
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            if int(data["version"]) != cls.VERSION or str(data["fingerprint"]) != cls.fingerprint(embeddings):
+                return None
+            return cls(embeddings, data["centroids"], data["assignments"], nprobe)
+    
+    def stats(self) -> Dict[str, Any]:
+        list_sizes = np.diff(self.list_offsets)
+        return {
+            "backend": self.name,
+            "vectors": len(self.embeddings),
+            "nlist": len(self.centroids),
+            "nprobe": self.nprobe,
+            "largest_list": int(list_sizes.max()) if len(list_sizes) else 0
+        }
+
+class QuantizedVectorIndex:
+    """Compressed copy of the embedding matrix with full-precision re-ranking.
+    
+    Vectors are stored as float16 or as int8 with one scale per vector.
+    Every query is scored against the compressed matrix, and the best
+    ``rerank_factor * top_k`` candidates are re-scored with the
+    full-precision rows, which may live in a memory-mapped file.
+    """
+    
+    name = "quantized"
+    CHUNK_SIZE = 16384  # rows decompressed per matmul, bounds the float32 scratch space
+    
+    def __init__(self, embeddings: np.ndarray, codes: np.ndarray, scales: np.ndarray, dtype: str,
+                 rerank_factor: int = RERANK_FACTOR):
+        self.embeddings = embeddings  # full precision, used for re-ranking only
+        self.codes = codes
+        self.scales = scales  # (N,) per-vector scale for int8, None for float16
+        self.dtype = dtype
+        self.rerank_factor = max(1, rerank_factor)
+        self.recall = {}  # measured on first stats() call, see measure_recall
+    
+    @staticmethod
+    def quantize(vectors: np.ndarray, dtype: str) -> (np.ndarray, np.ndarray):
+        """Compress float32 rows to float16 or scaled int8 codes"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if dtype == "float16":
+            return vectors.astype(np.float16), None
+        if dtype == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127
+            scales[scales == 0] = 1.0
+            codes = np.round(vectors / scales[:, None]).astype(np.int8)
+            return codes, scales.astype(np.float32)
+        raise ValueError(f"Unsupported quantization '{dtype}', expected float16 or int8")
+    
+    @classmethod
+    def build(cls, embeddings: np.ndarray, dtype: str = QUANTIZATION, rerank_factor: int = RERANK_FACTOR,
+              chunk_size: int = CHUNK_SIZE) -> 'QuantizedVectorIndex':
+        codes = np.empty((len(embeddings), embeddings.shape[1]), dtype=np.float16 if dtype == "float16" else np.int8)
+        scales = None if dtype == "float16" else np.empty(len(embeddings), dtype=np.float32)
+        for start in range(0, len(embeddings), chunk_size):
+            chunk_codes, chunk_scales = cls.quantize(embeddings[start:start + chunk_size], dtype)
+            codes[start:start + chunk_size] = chunk_codes
+            if scales is not None:
+                scales[start:start + chunk_size] = chunk_scales
+        return cls(embeddings, codes, scales, dtype, rerank_factor)
+    
+    def approximate_scores(self, query_vector: np.ndarray, rows: np.ndarray = None) -> np.ndarray:
+        """Dot products against the compressed matrix (or only its ``rows``), decompressed one chunk at a time"""
+        count = len(self.codes) if rows is None else len(rows)
+        scores = np.empty(count, dtype=np.float32)
+        for start in range(0, count, self.CHUNK_SIZE):
+            selection = slice(start, start + self.CHUNK_SIZE) if rows is None else rows[start:start + self.CHUNK_SIZE]
+            chunk = self.codes[selection].astype(np.float32)
+            scores[start:start + self.CHUNK_SIZE] = chunk @ query_vector
+        if self.scales is not None:
+            scores *= self.scales if rows is None else self.scales[rows]
+        return scores
+    
+    def search(self, query_vector: np.ndarray, top_k: int, boost: np.ndarray, rerank: bool = True,
+               allowed: np.ndarray = None) -> (np.ndarray, np.ndarray):
+        """Return the top_k row indices and their boosted cosine scores, only scoring ``allowed`` rows if given"""
+        rows = np.flatnonzero(allowed) if allowed is not None else None
+        scores = self.approximate_scores(query_vector, rows) * (boost if rows is None else boost[rows])
+        if not rerank:
+            winners = top_k_indices(scores, top_k)
+            return (winners if rows is None else rows[winners]), scores[winners]
+        
+        # Re-rank a wider candidate set with exact scores
+        candidates = top_k_indices(scores, top_k * self.rerank_factor)
+        candidates = np.sort(candidates if rows is None else rows[candidates])
+        exact = (np.asarray(self.embeddings[candidates], dtype=np.float32) @ query_vector) * boost[candidates]
+        winners = top_k_indices(exact, top_k)
+        return candidates[winners], exact[winners]
+    
+    def measure_recall(self, samples: int = 100, top_k: int = 10, seed: int = 0,
+                       max_rows: int = RECALL_SAMPLE_ROWS) -> Dict[str, float]:
+        """Recall@k of compressed and re-ranked search against exact search on synthetic queries.
+        
+        Large indexes are measured on a random sample of ``max_rows`` rows, so
+        the cost stays bounded however many vectors there are.
+        """
+        n = len(self.embeddings)
+        if n == 0:
+            return {}
+        rng = np.random.default_rng(seed)
+        sample = self
+        if n > max_rows:
+            rows = np.sort(rng.choice(n, size=max_rows, replace=False))
+            sample = QuantizedVectorIndex(np.asarray(self.embeddings[rows], dtype=np.float32), self.codes[rows],
+                                          None if self.scales is None else self.scales[rows], self.dtype,
+                                          self.rerank_factor)
+            n = max_rows
+        boost = np.ones(n, dtype=np.float32)
+        exact_index = ExactVectorIndex(sample.embeddings)
+        k = min(top_k, n)
+        
+        hits_compressed = hits_reranked = 0
+        for _ in range(samples):
+            # Queries near the data: the normalised sum of two random rows
+            query = np.asarray(sample.embeddings[rng.integers(0, n, 2)], dtype=np.float32).sum(axis=0)
+            query /= max(float(np.linalg.norm(query)), 1e-12)
+            truth = set(exact_index.search(query, k, boost)[0].tolist())
+            hits_compressed += len(truth & set(sample.search(query, k, boost, rerank=False)[0].tolist()))
+            hits_reranked += len(truth & set(sample.search(query, k, boost)[0].tolist()))
+        return {
+            f"recall_at_{k}_compressed": hits_compressed / (samples * k),
+            f"recall_at_{k}_reranked": hits_reranked / (samples * k),
+            "recall_sample_rows": n
+        }
+    
+    def artifact_sections(self) -> (Dict[str, Any], Dict[str, np.ndarray]):
+        """Parameters and arrays stored in an index artifact (see IndexArtifact)"""
+        arrays = {"codes": self.codes}
+        if self.scales is not None:
+            arrays["scales"] = self.scales
+        return {"dtype": self.dtype, "recall": self.recall}, arrays  # recall may still be unmeasured ({})
+    
+    @classmethod
+    def from_artifact_sections(cls, embeddings: np.ndarray, params: Dict[str, Any],
+                               arrays: Dict[str, np.ndarray]) -> 'QuantizedVectorIndex':
+        vector_index = cls(embeddings, arrays["codes"], arrays.get("scales"), params["dtype"])
+        vector_index.recall = params["recall"]
+        return vector_index
+    
+    def remap(self, embeddings: np.ndarray, old_to_new: np.ndarray, added: List[int]) -> 'QuantizedVectorIndex':
+        """Carry codes of kept rows over to a reloaded snapshot and quantize only the new rows"""
+        codes = np.zeros((len(embeddings), self.codes.shape[1]), dtype=self.codes.dtype)
+        scales = None if self.scales is None else np.ones(len(embeddings), dtype=np.float32)
+        kept = np.flatnonzero(old_to_new >= 0)
+        codes[old_to_new[kept]] = self.codes[kept]
+        if scales is not None:
+            scales[old_to_new[kept]] = self.scales[kept]
+        if len(added):
+            added_codes, added_scales = self.quantize(embeddings[added], self.dtype)
+            codes[added] = added_codes
+            if scales is not None:
+                scales[added] = added_scales
+        return QuantizedVectorIndex(embeddings, codes, scales, self.dtype, self.rerank_factor)
+    
+    def stats(self) -> Dict[str, Any]:
+        compressed_bytes = self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+        full_bytes = len(self.embeddings) * self.embeddings.shape[1] * 4
+        return {
+            "backend": self.name,
+            "vectors": len(self.codes),
+            "dtype": self.dtype,
+            "rerank_factor": self.rerank_factor,
+            "compressed_bytes": compressed_bytes,
+            "full_precision_bytes": full_bytes,
+            "full_precision_memory_mapped": isinstance(self.embeddings, np.memmap),
+            "compression_ratio": full_bytes / compressed_bytes if compressed_bytes else 0.0,
+            **self.get_recall()
+        }
+    
+    def get_recall(self) -> Dict[str, float]:
+        """Recall figures, measured once per index on first use instead of on every build or reload"""
+        if not self.recall and len(self.embeddings):
+            self.recall = self.measure_recall()
+        return self.recall
+
+VECTOR_INDEX_BACKENDS = {
+    ExactVectorIndex.name: ExactVectorIndex,
+    IVFVectorIndex.name: IVFVectorIndex,
+    QuantizedVectorIndex.name: QuantizedVectorIndex
+}
+
+def stream_lines(path: str, digest=None) -> Iterator[str]:
+    """Yield a text file's lines, feeding them to ``digest`` (e.g. hashlib.sha256()) as they are read"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if digest is not None:
+                digest.update(line.encode('utf-8'))
+            yield line
+
+def file_signature(path: str) -> str:
+    """The sha256 that stream_lines feeds while parsing a file, without parsing it"""
+    digest = hashlib.sha256()
+    for _ in stream_lines(path, digest):
+        pass
+    return digest.hexdigest()
+
+class MarkdownChunker:
+    """Streaming markdown splitter producing header-scoped, token-budgeted chunks.
+    
+    Lines are consumed one at a time and only the current chunk is buffered,
+    so memory is bounded by the chunk size rather than the file size. A
+    section that exceeds ``max_tokens`` is split at line (or, for very long
+    lines, word) boundaries; each continuation chunk repeats the section
+    header and roughly the last ``overlap_tokens`` of the previous chunk.
+    """
+    
+    def __init__(self, count_tokens: Callable[[str], int], max_tokens: int, overlap_tokens: int = CHUNK_OVERLAP_TOKENS):
+        self.count_tokens = count_tokens
+        self.count_word_tokens = functools.lru_cache(maxsize=65536)(count_tokens)  # words repeat a lot
+        self.max_tokens = max(16, max_tokens)
+        self.overlap_tokens = max(0, min(overlap_tokens, self.max_tokens // 2))
+    
+    def chunks(self, lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+        """Yield {'title', 'headers', 'part', 'content'} chunks in document order"""
+        headers = []  # (level, title) of the enclosing headers
+        title, header_line, header_tokens = 'Introduction', None, 0
+        body, body_tokens, part = [], 0, 0  # body holds (text, tokens) pieces of the current chunk
+        
+        def emit():
+            pieces = ([header_line] if header_line is not None else []) + [text for text, _ in body]
+            return {
+                'title': title,
+                'headers': [name for _, name in headers],
+                'part': part,
+                'content': ''.join(piece + '\n' for piece in pieces)
+            }
+        
+        for line in lines:
+            line = line.rstrip('\r\n')
+            
+            if line.startswith('#'):
+                if header_line is not None or any(text.strip() for text, _ in body):
+                    yield emit()
+                level = len(line) - len(line.lstrip('#'))
+                title = line.lstrip('#').strip()
+                headers = [(h_level, h_title) for h_level, h_title in headers if h_level < level] + [(level, title)]
+                header_line, header_tokens = line, self.count_tokens(line)
+                body, body_tokens, part = [], 0, 0
+                continue
+            
+            budget = max(1, self.max_tokens - header_tokens)
+            for text, tokens in self.split_line(line, budget):
+                if body_tokens + tokens > budget and any(piece.strip() for piece, _ in body):
+                    yield emit()
+                    body = self.overlap(body)
+                    body_tokens = sum(piece_tokens for _, piece_tokens in body)
+                    part += 1
+                    if body_tokens + tokens > budget:
+                        body, body_tokens = [], 0
+                body.append((text, tokens))
+                body_tokens += tokens
+        
+        if header_line is not None or any(text.strip() for text, _ in body):
+            yield emit()
+    
+    def split_line(self, line: str, budget: int) -> List[tuple]:
+        """(text, tokens) pieces of a line, breaking lines longer than budget between words"""
+        tokens = self.count_tokens(line) if line.strip() else 0
+        if tokens <= budget:
+            return [(line, tokens)]
+        
+        pieces, words, words_tokens = [], [], 0
+        for word in line.split(' '):
+            word_tokens = self.count_word_tokens(word) if word else 0
+            if words and words_tokens + word_tokens > budget:
+                pieces.append((' '.join(words), words_tokens))
+                words, words_tokens = [], 0
+            words.append(word)
+            words_tokens += word_tokens
+        if words:
+            pieces.append((' '.join(words), words_tokens))
+        return pieces
+    
+    def overlap(self, body: List[tuple]) -> List[tuple]:
+        """Trailing pieces (and words) of a chunk worth about overlap_tokens, to start the next chunk"""
+        carried, carried_tokens = [], 0
+        for text, tokens in reversed(body):
+            if carried_tokens + tokens <= self.overlap_tokens:
+                carried.insert(0, (text, tokens))
+                carried_tokens += tokens
+                continue
+            # Carry the tail of a piece that does not fit whole
+            tail = []
+            for word in reversed(text.split(' ')):
+                word_tokens = self.count_word_tokens(word) if word else 0
+                if carried_tokens + word_tokens > self.overlap_tokens:
+                    break
+                tail.insert(0, word)
+                carried_tokens += word_tokens
+            if tail:
+                carried.insert(0, (' '.join(tail), self.count_tokens(' '.join(tail))))
+            break
+        return carried
+
+class TextAnalyzer:
+    """BM25 text analysis and the term vocabulary shared by every index build.
+    
+    Text is lowercased and split into word runs; short and stop words are
+    dropped and, with ``stemming``, plurals are reduced to their singular.
+    Terms get stable integer ids in first-seen order. Analysis results are
+    memoised per raw word, so repeated words cost one dict lookup.
+    """
+    
+    WORD_PATTERN = re.compile(r'\w+')
+    STOP_WORDS = frozenset({
+        'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by',
+        'is', 'are', 'was', 'were', 'be', 'been', 'being', 'have', 'has', 'had', 'do', 'does', 'did',
+        'will', 'would', 'could', 'should', 'may', 'might', 'can', 'this', 'that', 'these', 'those',
+        'from', 'up', 'out', 'down', 'off', 'over', 'under', 'again', 'further', 'then', 'once'
+    })
+    DROPPED = -1
+    
+    def __init__(self, stemming: bool = BM25_STEMMING):
+        self.stemming = stemming
+        self.terms = []  # term id -> term
+        self.vocabulary = {}  # term -> term id
+        self.word_ids = {}  # raw word -> term id, or DROPPED for short and stop words
+    
+    @property
+    def config(self) -> str:
+        return f"word|min_length=3|stop_words={len(self.STOP_WORDS)}|stemming={int(self.stemming)}"
+    
+    @staticmethod
+    def stem(word: str) -> str:
+        """Light plural stemming (Harman's S-stemmer)"""
+        if word.endswith('ies') and not word.endswith(('eies', 'aies')):
+            return word[:-3] + 'y'
+        if word.endswith('es') and not word.endswith(('aes', 'ees', 'oes')):
+            return word[:-1]
+        if word.endswith('s') and not word.endswith(('us', 'ss')):
+            return word[:-1]
+        return word
+    
+    def normalize(self, word: str) -> str:
+        """The term a lowercased word indexes as, or None if it is dropped"""
+        if len(word) <= 2 or word in self.STOP_WORDS:
+            return None
+        return self.stem(word) if self.stemming else word
+    
+    def analyze(self, text: str) -> List[str]:
+        """Terms of text, in order"""
+        terms = (self.normalize(word) for word in self.WORD_PATTERN.findall(text.lower()))
+        return [term for term in terms if term is not None]
+    
+    def term_ids(self, text: str, add: bool = False) -> List[int]:
+        """Term ids of text, in order. Unknown terms are skipped unless ``add`` gives them new ids."""
+        ids = []
+        word_ids = self.word_ids
+        for word in self.WORD_PATTERN.findall(text.lower()):
+            term_id = word_ids.get(word)
+            if term_id is None:
+                term = self.normalize(word)
+                if term is None:
+                    term_id = self.DROPPED
+                else:
+                    term_id = self.vocabulary.get(term)
+                    if term_id is None:
+                        if not add:
+                            continue  # not indexed (yet), so not memoised either
+                        term_id = self.add_term(term)
+                word_ids[word] = term_id
+            if term_id != self.DROPPED:
+                ids.append(term_id)
+        return ids
+    
+    def add_term(self, term: str) -> int:
+        """Id of an already analyzed term, assigning the next id if it is new"""
+        term_id = self.vocabulary.get(term)
+        if term_id is None:
+            self.terms.append(term)
+            term_id = len(self.terms) - 1
+            self.vocabulary[term] = term_id
+        return term_id
+    
+    def load_vocabulary(self, terms: List[str]):
+        """Adopt the vocabulary of a prebuilt index that extends this one (see open_index_artifact)"""
+        if self.terms and self.terms != terms[:len(self.terms)]:
+            raise ValueError("Analyzer vocabulary conflicts with the prebuilt index")
+        self.terms = list(terms)
+        self.vocabulary = {term: term_id for term_id, term in enumerate(self.terms)}
+        self.word_ids = {}
+
+# File name -> (document type, priority); other markdown files are 'general'
+MARKDOWN_FILE_TYPES = {
+    'about.md': ('about', 10),
+    'research_details.md': ('research', 9),
+    'publications_detailed.md': ('publications', 8),
+    'skills_expertise.md': ('skills', 7),
+    'experience_detailed.md': ('experience', 8),
+    'statistics.md': ('statistics', 9)
+}
+
+def markdown_documents(lines: Iterable[str], filename: str, chunker: MarkdownChunker) -> List[Dict]:
+    """Chunk one markdown file into knowledge base documents; ids are assigned by the caller"""
+    file_type, priority = MARKDOWN_FILE_TYPES.get(filename, ('general', 5))
+    documents = []
+    for section in chunker.chunks(lines):
+        # Only process substantial content; continuation chunks of long sections always are
+        if len(section['content'].strip()) > 100 or section['part'] > 0:
+            documents.append({
+                "id": None,
+                "content": section['content'],
+                "metadata": {
+                    "type": file_type,
+                    "priority": priority,
+                    "section": section['title'],
+                    "section_path": " > ".join(section['headers']),
+                    "chunk": section['part'],
+                    "source": filename
+                }
+            })
+    return documents
+
+def find_markdown_files(files: List[str], directories: List[str] = ()) -> List[str]:
+    """The given files followed by every *.md file under directories, in a stable order"""
+    found = list(files)
+    for directory in directories:
+        for root, subdirectories, names in os.walk(directory):
+            subdirectories.sort()
+            found.extend(os.path.join(root, name) for name in sorted(names) if name.endswith('.md'))
+    return list(dict.fromkeys(found))
+
+def load_chunk_token_counter(model_name: str) -> Callable[[str], int]:
+    """Token counter for chunking, preferring the Rust tokenizer: loading it does not import torch,
+    so chunking during fast start and in build workers does not wait for the model libraries"""
+    try:
+        from tokenizers import Tokenizer
+        local_file = os.path.join(model_name, "tokenizer.json")
+        tokenizer = Tokenizer.from_file(local_file) if os.path.isfile(local_file) else \
+            Tokenizer.from_pretrained(model_name)
+        # tokenizer.json may enable the model's truncation and padding; chunking needs the full count
+        tokenizer.no_truncation()
+        tokenizer.no_padding()
+        return lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+    except Exception as e:
+        # Models without a tokenizer.json only have a Python tokenizer
+        print(f"⚠️ No fast tokenizer for chunking ({e}), using transformers")
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        return lambda text: len(tokenizer.tokenize(text))
+
+_build_worker = {}  # chunker and analyzer of an index build worker process
+
+def init_build_worker(model_name: str, max_tokens: int, overlap_tokens: int, stemming: bool,
+                      inference_backend: str = "torch"):
+    if inference_backend == "stub":
+        count_tokens = StubEncoder.count_tokens
+    else:
+        count_tokens = load_chunk_token_counter(model_name)
+    _build_worker["chunker"] = MarkdownChunker(count_tokens, max_tokens, overlap_tokens)
+    _build_worker["analyzer"] = TextAnalyzer(stemming)
+
+def parse_markdown_file(filename: str, chunker: MarkdownChunker = None, analyzer: TextAnalyzer = None) -> Dict[str, Any]:
+    """Read, chunk and analyze one markdown file: the unit of work of an index build.
+    
+    Returns the file signature, its documents and, per document, the BM25
+    (term, frequency) pairs in first-occurrence order. Terms are returned as
+    strings; the build assigns term ids when it merges files in order, so
+    parallel and serial builds produce identical indexes.
+    """
+    chunker = chunker or _build_worker["chunker"]
+    analyzer = analyzer or _build_worker["analyzer"]
+    digest = hashlib.sha256()
+    documents = markdown_documents(stream_lines(filename, digest), filename, chunker)
+    return {
+        "filename": filename,
+        "signature": digest.hexdigest(),
+        "documents": documents,
+        "term_counts": [list(Counter(analyzer.analyze(doc["content"])).items()) for doc in documents]
+    }
+
+RESULT_PROJECTIONS = ("full", "snippet", "ids")
+
+class MappedTexts:
+    """Read-only sequence of strings stored back to back as UTF-8 in two (memory-mapped) arrays"""
+    
+    def __init__(self, offsets: np.ndarray, data: np.ndarray):
+        self.offsets = offsets  # (N + 1,) int64 byte offsets into data
+        self.data = data  # uint8
+    
+    @staticmethod
+    def pack(texts: Iterable[str]) -> (np.ndarray, np.ndarray):
+        encoded = [text.encode("utf-8") for text in texts]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(item) for item in encoded])
+        return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+    
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError(position)
+        return self.data[self.offsets[position]:self.offsets[position + 1]].tobytes().decode("utf-8")
+    
+    def __iter__(self) -> Iterator[str]:
+        return (self[i] for i in range(len(self)))
+
+class DocumentStore:
+    """Columnar knowledge base: one list per field instead of one dict per section.
+    
+    Metadata strings repeat across thousands of sections (type, source,
+    section title), so they are interned and stored once. Indexing returns a
+    freshly built document dict, which keeps callers from mutating the store.
+    """
+    
+    __slots__ = ("ids", "contents", "types", "priorities", "sections", "section_paths", "chunks", "sources")
+    
+    def __init__(self, documents: Iterable[Dict] = ()):
+        self.ids = []
+        self.contents = []
+        self.types = []
+        self.priorities = []
+        self.sections = []
+        self.section_paths = []
+        self.chunks = []
+        self.sources = []
+        for doc in documents:
+            self.append(doc)
+    
+    def append(self, doc: Dict):
+        metadata = doc["metadata"]
+        self.ids.append(doc["id"])
+        self.contents.append(doc["content"])
+        self.types.append(sys.intern(metadata["type"]))
+        self.priorities.append(metadata["priority"])
+        self.sections.append(sys.intern(metadata["section"]))
+        self.section_paths.append(sys.intern(metadata.get("section_path", "")))
+        self.chunks.append(metadata.get("chunk", 0))
+        self.sources.append(sys.intern(metadata["source"]))
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+    
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self.document(i) for i in range(*position.indices(len(self)))]
+        return self.document(int(position))
+    
+    def __iter__(self) -> Iterator[Dict]:
+        return (self.document(i) for i in range(len(self)))
+    
+    def metadata(self, i: int) -> Dict[str, Any]:
+        return {
+            "type": self.types[i],
+            "priority": self.priorities[i],
+            "section": self.sections[i],
+            "section_path": self.section_paths[i],
+            "chunk": self.chunks[i],
+            "source": self.sources[i]
+        }
+    
+    def document(self, i: int) -> Dict[str, Any]:
+        return {"id": self.ids[i], "content": self.contents[i], "metadata": self.metadata(i)}
+    
+    def priority_boost(self, divisor: float) -> np.ndarray:
+        """Per-document ``1 + priority / divisor`` multiplier for ranking"""
+        return (1 + np.array(self.priorities, dtype=np.float64) / divisor).astype(np.float32)
+    
+    def to_list(self) -> List[Dict]:
+        return list(self)
+    
+    @classmethod
+    def with_contents(cls, documents: Iterable[Dict], contents) -> 'DocumentStore':
+        """Store with metadata from documents and section text from a separate sequence, e.g. MappedTexts"""
+        store = cls(dict(document, content=None) for document in documents)
+        store.contents = contents
+        return store
+
+def project_results(results: List[Dict], projection: str = "full", snippet_chars: int = 200) -> List[Dict]:
+    """Copies of search results whose documents are cut down to the requested projection"""
+    if projection not in RESULT_PROJECTIONS:
+        raise ValueError(f"Unknown projection '{projection}', expected one of {', '.join(RESULT_PROJECTIONS)}")
+    if projection == "full":
+        return results
+    projected = []
+    for result in results:
+        doc = result['document']
+        if projection == "ids":
+            document = {"id": doc["id"]}
+        else:
+            content = doc["content"]
+            if len(content) > snippet_chars:
+                content = content[:max(0, snippet_chars)].rstrip() + "..."
+            document = {"id": doc["id"], "content": content, "metadata": doc["metadata"]}
+        projected.append({**result, 'document': document})
+    return projected
+
+METADATA_FILTER_FIELDS = ("type", "source")
+PRIORITY_FILTER_FIELDS = ("min_priority", "max_priority")
+
+def parse_filters(filters) -> Dict[str, Any]:
+    """Validate metadata filters given as a dict or JSON object; None when nothing is filtered.
+    
+    ``type`` and ``source`` take one value or a list of values, and
+    ``min_priority`` / ``max_priority`` bound the priority inclusively.
+    """
+    if isinstance(filters, str):
+        filters = json.loads(filters) if filters.strip() else None
+    if not filters:
+        return None
+    if not isinstance(filters, dict):
+        raise ValueError("Filters must be a JSON object")
+    unknown = set(filters) - set(METADATA_FILTER_FIELDS) - set(PRIORITY_FILTER_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown filter fields {sorted(unknown)}, expected "
+                         f"{', '.join(METADATA_FILTER_FIELDS + PRIORITY_FILTER_FIELDS)}")
+    parsed = {}
+    for field in METADATA_FILTER_FIELDS:
+        if filters.get(field) not in (None, "", []):
+            values = filters[field] if isinstance(filters[field], list) else [filters[field]]
+            parsed[field] = sorted(str(value) for value in values)
+    for field in PRIORITY_FILTER_FIELDS:
+        if filters.get(field) not in (None, ""):
+            parsed[field] = float(filters[field])
+    return parsed or None
+
+class IndexSnapshot:
+    """One build of the knowledge base together with its vector and BM25 indexes.
+    
+    Snapshots are never modified after publication: searches read
+    ``bot.index`` once and use that snapshot throughout, and reloads build
+    a new snapshot and publish it with a single reference assignment.
+    """
+    
+    def __init__(self):
+        self.version = 0
+        self.knowledge_base = DocumentStore()
+        self.file_signatures = {}  # filename -> sha256 of the file content the sections came from
+        
+        # Vector index
+        self.embeddings = np.zeros((0, EMBEDDING_DIM), dtype=np.float32)  # (N, dim), rows L2-normalised
+        self.vector_priority_boost = np.zeros(0, dtype=np.float32)  # (N,) multiplier applied to cosine scores
+        self.vector_indexes = {}  # backend name -> vector index over embeddings, built on demand
+        
+        # BM25 components (inverted index over knowledge_base positions), keyed by analyzer term id
+        self.terms = []  # term id -> term, the analyzer vocabulary when this index was built
+        self.analyzer = None  # TextAnalyzer whose term ids the BM25 components use
+        self.postings = {}  # term id -> (doc indices int32, term frequencies float32)
+        self.posting_weights = {}  # term id -> precomputed BM25 contribution of each posting
+        self.term_upper_bounds = {}  # term id -> max(0, largest posting weight), used by max-score pruning
+        self.term_lower_bounds = {}  # term id -> min(0, smallest posting weight), negative IDF can lower scores
+        self.document_frequency = {}  # term id -> number of docs containing term
+        self.idf = {}  # term id -> inverse document frequency
+        self.bm25_matrix = None  # CSR (term ids x documents) of posting weights, needs scipy
+        self.document_lengths = np.zeros(0, dtype=np.int32)  # doc index -> document length
+        self.bm25_priority_boost = np.zeros(0, dtype=np.float32)  # doc index -> priority multiplier
+        self.average_doc_length = 0
+        self.total_documents = 0
+        
+        # Metadata filter codes, built alongside the BM25 index; masks are derived per query
+        self.metadata_codes = {}  # field -> doc index -> int32 code of the document's value
+        self.metadata_values = {}  # field -> value -> code
+        self.priorities = np.zeros(0, dtype=np.int32)  # doc index -> priority
+    
+    def copy_documents(self) -> 'IndexSnapshot':
+        """New unpublished snapshot sharing this one's documents and embeddings, without BM25 state"""
+        index = IndexSnapshot()
+        index.knowledge_base = self.knowledge_base
+        index.file_signatures = self.file_signatures
+        index.embeddings = self.embeddings
+        index.vector_priority_boost = self.vector_priority_boost
+        index.vector_indexes = self.vector_indexes
+        return index
+    
+    def build_metadata_codes(self):
+        """Encode each document's type and source as an integer code for filtered search.
+        
+        One code per document per field keeps memory at 4 bytes per document
+        however many distinct values there are; filter_mask compares codes.
+        """
+        self.metadata_codes = {}
+        self.metadata_values = {}
+        for field, column in (("type", self.knowledge_base.types), ("source", self.knowledge_base.sources)):
+            if not column:
+                self.metadata_codes[field] = np.zeros(0, dtype=np.int32)
+                self.metadata_values[field] = {}
+                continue
+            values, inverse = np.unique(np.array(column), return_inverse=True)
+            self.metadata_codes[field] = inverse.astype(np.int32)
+            self.metadata_values[field] = {str(value): code for code, value in enumerate(values)}
+        self.priorities = np.array(self.knowledge_base.priorities, dtype=np.int32)
+    
+    def filter_mask(self, filters: Dict[str, Any]) -> np.ndarray:
+        """Documents matching parsed filters (values of one field are OR-ed, fields AND-ed), or None"""
+        if not filters:
+            return None
+        mask = np.ones(len(self.priorities), dtype=bool)
+        for field in METADATA_FILTER_FIELDS:
+            if field in filters:
+                values = self.metadata_values.get(field, {})
+                wanted = [values[value] for value in filters[field] if value in values]
+                mask &= np.isin(self.metadata_codes[field], wanted)
+        if "min_priority" in filters:
+            mask &= self.priorities >= filters["min_priority"]
+        if "max_priority" in filters:
+            mask &= self.priorities <= filters["max_priority"]
+        return mask
+
+class PostingsView(Mapping):
+    """Read-only term id -> value mapping over CSR-packed posting arrays.
+    
+    Stands in for the per-term dicts of a built snapshot when the arrays
+    are memory-mapped, so attaching to an artifact creates no Python object
+    per term.
+    """
+    
+    def __init__(self, offsets: np.ndarray, value: Callable[[int, int, int], Any], term_ids: np.ndarray = None):
+        self.offsets = offsets
+        self.value = value  # (term id, start, end) -> value
+        self.term_ids = np.flatnonzero(np.diff(offsets)) if term_ids is None else term_ids
+    
+    def __getitem__(self, term_id: int):
+        if not isinstance(term_id, (int, np.integer)) or not 0 <= term_id < len(self.offsets) - 1:
+            raise KeyError(term_id)
+        start, end = int(self.offsets[term_id]), int(self.offsets[term_id + 1])
+        if start == end:
+            raise KeyError(term_id)
+        return self.value(int(term_id), start, end)
+    
+    def __contains__(self, term_id) -> bool:
+        return isinstance(term_id, (int, np.integer)) and 0 <= term_id < len(self.offsets) - 1 and \
+            self.offsets[term_id + 1] > self.offsets[term_id]
+    
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.term_ids.tolist())
+    
+    def __len__(self) -> int:
+        return len(self.term_ids)
+
+class IndexArtifact:
+    """Single-file, versioned on-disk format for a fully built IndexSnapshot.
+    
+    Layout: an 8-byte magic, a little-endian uint64 header length, a JSON
+    header (build parameters, document ids and metadata, vocabulary and a
+    table of array sections), then 64-byte aligned raw array sections,
+    including the section text and any built quantized or IVF index.
+    Arrays are opened with ``np.memmap``, so
+    loading an artifact copies no index data and processes that open the
+    same file share one copy of it through the page cache.
+    """
+    
+    MAGIC = b"RAGIDX01"
+    FORMAT_VERSION = 3
+    ALIGNMENT = 64
+    
+    @staticmethod
+    def checksum(array: np.ndarray) -> str:
+        # Hash the buffer in place; tobytes() would copy a mapped section into private memory
+        return hashlib.sha256(np.ascontiguousarray(array).data).hexdigest()
+    
+    @classmethod
+    def write(cls, path: str, index: IndexSnapshot, build_info: Dict[str, Any]):
+        """Serialise index to path (atomically, via a temporary file)"""
+        # One posting range per vocabulary term id; terms that no longer occur get an empty range
+        term_ids = sorted(index.postings)
+        lengths = np.zeros(len(index.terms), dtype=np.int64)
+        lengths[term_ids] = [len(index.postings[term_id][0]) for term_id in term_ids]
+        offsets = np.zeros(len(index.terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(lengths)
+        idf = np.zeros(len(index.terms), dtype=np.float64)
+        idf[term_ids] = [index.idf[term_id] for term_id in term_ids]
+        
+        def concat(arrays, dtype):
+            return np.concatenate(arrays).astype(dtype) if arrays else np.zeros(0, dtype=dtype)
+        
+        documents = index.knowledge_base
+        content_offsets, content_bytes = MappedTexts.pack(documents.contents)
+        arrays = {
+            "embeddings": np.ascontiguousarray(index.embeddings, dtype=np.float32),
+            "document_lengths": index.document_lengths.astype(np.int32),
+            "posting_offsets": offsets,
+            "posting_doc_indices": concat([index.postings[term_id][0] for term_id in term_ids], np.int32),
+            "posting_frequencies": concat([index.postings[term_id][1] for term_id in term_ids], np.float32),
+            "posting_weights": concat([index.posting_weights[term_id] for term_id in term_ids], np.float32),
+            "idf": idf,
+            "content_offsets": content_offsets,
+            "content_bytes": content_bytes,
+            "priorities": index.priorities.astype(np.int32)
+        }
+        # Filter metadata is one code per document per field, with the values listed in code order
+        metadata_values = {}
+        for field in METADATA_FILTER_FIELDS:
+            metadata_values[field] = sorted(index.metadata_values[field], key=index.metadata_values[field].get)
+            arrays[f"{field}_codes"] = index.metadata_codes[field].astype(np.int32)
+        
+        # Built ANN indexes are stored too, so processes mapping the artifact do not rebuild them
+        vector_indexes = {}
+        for name, vector_index in index.vector_indexes.items():
+            if hasattr(vector_index, "artifact_sections"):
+                vector_indexes[name], index_arrays = vector_index.artifact_sections()
+                arrays.update({f"{name}_{key}": array for key, array in index_arrays.items()})
+        
+        # Lay sections out after the header, each aligned for efficient mapping
+        sections = {}
+        position = 0
+        for name, array in arrays.items():
+            position = -(-position // cls.ALIGNMENT) * cls.ALIGNMENT
+            sections[name] = {
+                "offset": position,
+                "dtype": array.dtype.str,
+                "shape": list(array.shape),
+                "sha256": cls.checksum(array)
+            }
+            position += array.nbytes
+        
+        header = {
+            "format_version": cls.FORMAT_VERSION,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            **build_info,
+            "documents": [{"id": documents.ids[i], "metadata": documents.metadata(i)} for i in range(len(documents))],
+            "file_signatures": index.file_signatures,
+            "terms": index.terms,
+            "metadata_values": metadata_values,
+            "vector_indexes": vector_indexes,
+            "sections": sections
+        }
+        header_bytes = json.dumps(header).encode("utf-8")
+        data_start = -(-(len(cls.MAGIC) + 8 + len(header_bytes)) // cls.ALIGNMENT) * cls.ALIGNMENT
+        
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(cls.MAGIC)
+            f.write(len(header_bytes).to_bytes(8, "little"))
+            f.write(header_bytes)
+            for name, array in arrays.items():
+                f.seek(data_start + sections[name]["offset"])
+                f.write(np.ascontiguousarray(array).data)
+        os.replace(tmp_path, path)
+    
+    @classmethod
+    def read_header(cls, path: str) -> (Dict[str, Any], int):
+        """Return the JSON header and the file offset where array sections start"""
+        with open(path, "rb") as f:
+            if f.read(len(cls.MAGIC)) != cls.MAGIC:
+                raise ValueError(f"{path} is not a RAG index artifact")
+            header_length = int.from_bytes(f.read(8), "little")
+            header = json.loads(f.read(header_length).decode("utf-8"))
+        data_start = -(-(len(cls.MAGIC) + 8 + header_length) // cls.ALIGNMENT) * cls.ALIGNMENT
+        return header, data_start
+    
+    @classmethod
+    def read(cls, path: str, expected: Dict[str, Any], verify: bool = True) -> IndexSnapshot:
+        """Open an artifact zero-copy, refusing it if its build parameters differ from ``expected``"""
+        header, data_start = cls.read_header(path)
+        if header.get("format_version") != cls.FORMAT_VERSION:
+            raise ValueError(f"Unsupported index artifact format {header.get('format_version')}")
+        for key, value in expected.items():
+            if header.get(key) != value:
+                raise ValueError(f"Index artifact was built with {key}={header.get(key)!r}, expected {value!r}")
+        
+        arrays = {}
+        for name, section in header["sections"].items():
+            shape = tuple(section["shape"])
+            if int(np.prod(shape)) == 0:
+                arrays[name] = np.zeros(shape, dtype=np.dtype(section["dtype"]))
+                continue
+            arrays[name] = np.memmap(path, dtype=np.dtype(section["dtype"]), mode="r",
+                                     offset=data_start + section["offset"], shape=shape)
+            if verify and cls.checksum(arrays[name]) != section["sha256"]:
+                raise ValueError(f"Index artifact section '{name}' failed its checksum")
+        
+        index = IndexSnapshot()
+        index.knowledge_base = DocumentStore.with_contents(
+            header["documents"], MappedTexts(arrays["content_offsets"], arrays["content_bytes"])
+        )
+        index.file_signatures = header["file_signatures"]
+        index.embeddings = arrays["embeddings"]
+        index.document_lengths = arrays["document_lengths"]
+        index.total_documents = len(index.document_lengths)
+        index.average_doc_length = float(index.document_lengths.mean()) if index.total_documents > 0 else 0
+        index.priorities = arrays["priorities"]
+        index.metadata_codes = {field: arrays[f"{field}_codes"] for field in header["metadata_values"]}
+        index.vector_indexes = {
+            name: VECTOR_INDEX_BACKENDS[name].from_artifact_sections(
+                index.embeddings, params,
+                {key[len(name) + 1:]: array for key, array in arrays.items() if key.startswith(name + "_")}
+            )
+            for name, params in header.get("vector_indexes", {}).items()
+        }
+        index.metadata_values = {
+            field: {value: code for code, value in enumerate(values)}
+            for field, values in header["metadata_values"].items()
+        }
+        
+        # Posting lists are views into the mapped sections, looked up per term on demand
+        offsets = arrays["posting_offsets"]
+        doc_indices, frequencies, weights, idf = (
+            arrays["posting_doc_indices"], arrays["posting_frequencies"], arrays["posting_weights"], arrays["idf"]
+        )
+        index.terms = header["terms"]
+        term_ids = np.flatnonzero(np.diff(offsets))
+        upper_bounds = np.zeros(len(index.terms), dtype=np.float64)
+        lower_bounds = np.zeros(len(index.terms), dtype=np.float64)
+        if len(term_ids):
+            # Non-empty ranges are contiguous, so reduceat over their starts covers each range exactly
+            upper_bounds[term_ids] = np.maximum(np.maximum.reduceat(weights, offsets[term_ids]), 0.0)
+            lower_bounds[term_ids] = np.minimum(np.minimum.reduceat(weights, offsets[term_ids]), 0.0)
+        index.postings = PostingsView(offsets, lambda t, start, end: (doc_indices[start:end], frequencies[start:end]), term_ids)
+        index.posting_weights = PostingsView(offsets, lambda t, start, end: weights[start:end], term_ids)
+        index.document_frequency = PostingsView(offsets, lambda t, start, end: end - start, term_ids)
+        index.idf = PostingsView(offsets, lambda t, start, end: float(idf[t]), term_ids)
+        index.term_upper_bounds = PostingsView(offsets, lambda t, start, end: float(upper_bounds[t]), term_ids)
+        index.term_lower_bounds = PostingsView(offsets, lambda t, start, end: float(lower_bounds[t]), term_ids)
+        
+        # The CSR matrix for batch scoring is the same three sections
+        if sparse is not None:
+            index.bm25_matrix = sparse.csr_matrix(
+                (weights, doc_indices, offsets), shape=(len(header["terms"]), index.total_documents), copy=False
+            )
+        return index
+
+class SharedIndex:
+    """Generation-numbered index artifacts shared by one primary and many worker processes.
+    
+    The primary writes each build to ``index-<generation>.ragidx`` and then
+    atomically replaces ``generation.json`` to point at it. Workers poll the
+    pointer and memory-map the artifact it names, so every process serves
+    from the same page-cache copy of the index. Old artifacts are unlinked
+    after ``keep`` newer generations exist; processes that still map them
+    keep their pages until they move on.
+    """
+    
+    POINTER = "generation.json"
+    
+    def __init__(self, directory: str, keep: int = 2):
+        self.directory = directory
+        self.keep = max(1, keep)
+        self.pointer_path = os.path.join(directory, self.POINTER)
+        os.makedirs(directory, exist_ok=True)
+    
+    def current(self) -> Dict[str, Any]:
+        """The published generation record, or None before the first publish"""
+        try:
+            with open(self.pointer_path, "r", encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        record["path"] = os.path.join(self.directory, record["artifact"])
+        return record
+    
+    def publish(self, write: Callable[[str], None]) -> Dict[str, Any]:
+        """Write the next generation with ``write(path)`` and point readers at it"""
+        current = self.current()
+        generation = (current["generation"] if current else 0) + 1
+        artifact = f"index-{generation:06d}.ragidx"
+        write(os.path.join(self.directory, artifact))
+        
+        record = {"generation": generation, "artifact": artifact, "published_at": time.time(), "pid": os.getpid()}
+        tmp_path = self.pointer_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(record, f)
+        os.replace(tmp_path, self.pointer_path)
+        self.cleanup(generation)
+        record["path"] = os.path.join(self.directory, artifact)
+        return record
+    
+    def cleanup(self, generation: int):
+        """Unlink artifacts more than ``keep`` generations old"""
+        for filename in os.listdir(self.directory):
+            match = re.fullmatch(r"index-(\d+)\.ragidx", filename)
+            if match and int(match.group(1)) <= generation - self.keep:
+                try:
+                    os.remove(os.path.join(self.directory, filename))
+                except OSError:
+                    pass
+    
+    def wait(self, timeout: float, interval: float = 0.5) -> Dict[str, Any]:
+        """Block until a generation is published, returning None after ``timeout`` seconds"""
+        deadline = time.time() + timeout
+        while True:
+            record = self.current()
+            if record is not None and os.path.exists(record["path"]):
+                return record
+            if time.time() >= deadline:
+                return None
+            time.sleep(interval)
 
 class HybridSearchRAGBot:
-    def __init__(self):
-        self.embedder = None
-        self.knowledge_base = []
-        self.embeddings = []
-        
-        # BM25 components
-        self.term_frequencies = {}  # doc_id -> {term: frequency}
-        self.document_frequency = {}  # term -> number of docs containing term
-        self.document_lengths = {}  # doc_id -> document length
-        self.average_doc_length = 0
-        self.total_documents = 0
+    # Query-like probes for the ONNX parity check, scored against sample sections
+    PARITY_QUERIES = [
+        "What is Raktim's research about?",
+        "deep learning for medical imaging",
+        "Python and PyTorch experience",
+        "list of publications",
+        "teaching and academic roles",
+        "Which programming languages does he know?"
+    ]
+    # Built-in sections the probes are ranked against, so the check has rankings to compare even
+    # when the models load before any markdown is (the default, non-fast start)
+    PARITY_PASSAGES = [
+        "Raktim's research develops deep learning methods for cancer histopathology and survival prediction.",
+        "Medical image analysis with convolutional neural networks and attention-based multiple instance learning.",
+        "Skilled in Python, PyTorch, TensorFlow, scikit-learn and building reproducible machine learning pipelines.",
+        "Selected publications in peer-reviewed journals and conferences on bioinformatics and computer vision.",
+        "Taught undergraduate courses and supervised student research projects as a lecturer and teaching assistant.",
+        "Programming languages: Python, R, MATLAB, C++ and SQL, with experience in Linux and cloud computing.",
+        "Education: PhD in computer science and engineering, with a thesis on interpretable models for genomics.",
+        "Awards and scholarships received for academic excellence and research contributions.",
+        "Contact details, location and links to GitHub, Google Scholar and LinkedIn profiles.",
+        "Statistics and data analysis with hypothesis testing, regression and Bayesian modelling."
+    ]
+    
+    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME, embedding_batch_size: int = EMBEDDING_BATCH_SIZE,
+                 embedding_workers: int = EMBEDDING_WORKERS, max_seq_length: int = MAX_SEQ_LENGTH,
+                 embedding_cache_dir: str = EMBEDDING_CACHE_DIR, bm25_max_score: bool = BM25_MAX_SCORE,
+                 markdown_files: List[str] = None, vector_backend: str = VECTOR_BACKEND,
+                 index_artifact: str = INDEX_ARTIFACT, fast_start: bool = FAST_START,
+                 inference_backend: str = INFERENCE_BACKEND, markdown_directories: List[str] = None,
+                 build_workers: int = BUILD_WORKERS, shared_index_dir: str = SHARED_INDEX_DIR,
+                 serving_role: str = SERVING_ROLE):
+        self.model_name = model_name
+        self.tokenizer = None
+        self.model = None
+        self.device = None
+        if inference_backend not in ("torch", "onnx", "onnx-int8", "stub"):
+            raise ValueError(f"Unknown inference backend '{inference_backend}', expected torch, onnx, onnx-int8 or stub")
+        self.inference_backend = inference_backend
+        self.requested_inference_backend = inference_backend
+        self.onnx_encoder = None
+        self.inference_parity = {}
+        self.markdown_files = list(MARKDOWN_FILES if markdown_files is None else markdown_files)
+        self.markdown_directories = list(MARKDOWN_DIRS if markdown_directories is None else markdown_directories)
+        self.build_workers = max(1, build_workers)
+        if serving_role not in ("primary", "worker"):
+            raise ValueError(f"Unknown serving role '{serving_role}', expected primary or worker")
+        if serving_role == "worker" and not shared_index_dir:
+            raise ValueError("Worker processes need a shared index directory (RAG_SHARED_INDEX_DIR)")
+        
+        # Multi-process serving: the primary publishes generations, workers map them read-only
+        self.serving_role = serving_role
+        self.shared_index = SharedIndex(shared_index_dir) if shared_index_dir else None
+        self.shared_generation = 0
+        self.generation_follower = None
+        
+        # Published index snapshot; replaced atomically on rebuild or reload
+        self.index = IndexSnapshot()
+        self.reload_lock = threading.Lock()  # serialises rebuilds, searches never take it
+        self.watcher = None
+        
+        # Embedding parameters
+        self.embedding_batch_size = max(1, embedding_batch_size)
+        self.embedding_workers = max(1, embedding_workers)
+        self.max_seq_length = max_seq_length
+        self.chunk_token_counter = None  # separate tokenizer: chunking must not race query tokenization
+        self.chunker = MarkdownChunker(self.count_tokens, min(CHUNK_MAX_TOKENS or max_seq_length, max_seq_length) - 2)
+        self.pooling_config = f"mean-attention-mask|l2|max_seq_length={max_seq_length}"
+        if inference_backend != "torch":
+            # ONNX embeddings drift slightly, so they get their own cache entries
+            self.pooling_config += f"|backend={inference_backend}"
+        self.embedding_cache = EmbeddingCache(embedding_cache_dir) if embedding_cache_dir else None
+        
+        # Vector index backend used when a search does not ask for one
+        if vector_backend not in VECTOR_INDEX_BACKENDS:
+            raise ValueError(f"Unknown vector backend '{vector_backend}', expected one of {list(VECTOR_INDEX_BACKENDS)}")
+        self.vector_backend = vector_backend
+        self.vector_index_lock = threading.Lock()
+        
+        # Query caches; result keys include the index version, which bumps on every rebuild
+        self.query_embedding_cache = LRUCache(QUERY_EMBEDDING_CACHE_SIZE)
+        self.result_cache = LRUCache(RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL)
+        self.search_failures = contextvars.ContextVar("rag_search_failures", default=None)  # degraded results are not cached
+        
+        # Concurrent query embeddings are coalesced into one forward pass
+        self.query_batcher = EmbeddingBatcher(self.embed_texts) if BATCH_WINDOW_MS > 0 else None
         
         # BM25 parameters
         self.k1 = 1.5  # Controls term frequency saturation
         self.b = 0.75  # Controls document length normalization
+        self.bm25_max_score = bm25_max_score  # Max-score early termination for top-k queries
+        self.analyzer = TextAnalyzer()
         
-        self.initialize_models()
-        self.load_markdown_knowledge_base()
-        self.build_bm25_index()
+        # Hybrid search runs the vector retriever here while BM25 runs on the calling thread;
+        # tokenizer and model forward passes release the GIL
+        self.retriever_pool = ThreadPoolExecutor(max_workers=max(1, RETRIEVER_WORKERS), thread_name_prefix="retriever") \
+            if PARALLEL_RETRIEVAL else None
         
+        # Readiness: keyword search works once a snapshot is published, vector search once models_ready is set
+        self.fast_start = fast_start
+        self.status = "starting"
+        self.startup_error = None
+        self.models_ready = threading.Event()
+        self.startup_finished = threading.Event()  # set when start-up ends, whether or not the model loaded
+        self.startup_started = time.time()
+        self.startup_timings = {}  # stage -> seconds since startup_started
+        
+        # A prebuilt artifact serves searches without parsing, tokenizing or embedding anything
+        if serving_role == "worker":
+            loaded_artifact = self.attach_shared_index()
+        else:
+            loaded_artifact = bool(index_artifact) and os.path.exists(index_artifact) and \
+                self.load_index_artifact(index_artifact)
+        
+        if fast_start:
+            if not loaded_artifact:
+                self.load_markdown_knowledge_base(embed=False)
+            self.mark_startup("keyword_index")
+            self.status = "keyword_ready"
+            threading.Thread(target=self.warm_up, args=(loaded_artifact,), name="model-warm-up", daemon=True).start()
+        else:
+            self.initialize_models()
+            self.mark_startup("model_loaded")
+            if not loaded_artifact:
+                self.load_markdown_knowledge_base()
+            self.mark_startup("keyword_index")
+            self.mark_startup("embeddings")
+            self.models_ready.set()
+            self.status = "ready"
+            self.mark_startup("ready")
+            self.share_index()
+            self.startup_finished.set()
+    
+    def mark_startup(self, stage: str):
+        self.startup_timings[stage] = round(time.time() - self.startup_started, 3)
+    
+    def warm_up(self, loaded_artifact: bool):
+        """Background part of fast start: load the model, embed sections and switch to full hybrid search"""
+        try:
+            self.initialize_models()
+            self.mark_startup("model_loaded")
+            
+            if not loaded_artifact:
+                # Embed the published sections; BM25 state is shared with the keyword-only snapshot
+                with self.reload_lock:
+                    index = copy.copy(self.index)
+                    self.attach_embeddings(index)
+                    self.publish_index(index)
+            self.mark_startup("embeddings")
+            
+            # The first forward pass pays for lazy allocations; do it before real traffic
+            self.embed_texts(["warm up"])
+            self.mark_startup("warm_up")
+            
+            self.models_ready.set()
+            self.status = "ready"
+            self.mark_startup("ready")
+            print(f"✅ Vector search ready after {self.startup_timings['ready']:.1f}s, hybrid search now uses full fusion")
+            self.share_index()
+        except Exception as e:
+            self.status = "error"
+            self.startup_error = str(e)
+            print(f"❌ Background model loading failed, serving keyword search only: {e}")
+        finally:
+            self.startup_finished.set()
+    
+    def get_readiness(self) -> Dict[str, Any]:
+        """Startup and warm-up state for the stats endpoint"""
+        return {
+            "status": self.status,
+            "fast_start": self.fast_start,
+            "keyword_search_ready": self.index.version > 0,
+            "vector_search_ready": self.models_ready.is_set(),
+            "seconds_since_start": round(time.time() - self.startup_started, 3),
+            "startup_timings_seconds": dict(self.startup_timings),
+            "error": self.startup_error
+        }
+    
+    # Read-only views of the published snapshot
+    @property
+    def knowledge_base(self) -> DocumentStore:
+        return self.index.knowledge_base
+    
+    @property
+    def embeddings(self) -> np.ndarray:
+        return self.index.embeddings
+    
+    @property
+    def document_frequency(self) -> Dict[str, int]:
+        return self.index.document_frequency
+    
+    @property
+    def average_doc_length(self) -> float:
+        return self.index.average_doc_length
+    
+    @property
+    def total_documents(self) -> int:
+        return self.index.total_documents
+    
+    @property
+    def index_version(self) -> int:
+        return self.index.version
+    
+    def publish_index(self, index: IndexSnapshot):
+        """Make a fully built snapshot visible to searches with one reference swap"""
+        index.version = self.index.version + 1
+        self.index = index
+        if index.analyzer is not None:
+            # Later reloads extend the vocabulary of the published snapshot
+            self.analyzer = index.analyzer
+    
     def initialize_models(self):
         """Initialize the embedding model"""
+        if self.inference_backend == "stub":
+            self.device = "cpu"
+            print("⚠️ Using the stub embedder: vector scores are hashed word overlap, not semantic similarity")
+            return
         try:
-            print("Loading embedding model...")
-            self.embedder = pipeline(
-                'feature-extraction', 
-                'sentence-transformers/all-MiniLM-L6-v2',
-                device=0 if device == "cuda" else -1
-            )
+            # Heavy imports happen here so importing app.py stays cheap
+            import torch
+            from transformers import AutoTokenizer, AutoModel
+            
+            self.device = "cuda" if torch.cuda.is_available() else "cpu"
+            print(f"Loading embedding model on {self.device}...")
+            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+            self.model = AutoModel.from_pretrained(self.model_name).to(self.device)
+            self.model.eval()
             print("✅ Embedding model loaded successfully")
         except Exception as e:
             print(f"❌ Error loading embedding model: {e}")
             raise e
+        
+        if self.inference_backend != "torch":
+            self.initialize_onnx()
     
-    def load_markdown_knowledge_base(self):
-        """Load knowledge base from markdown files"""
-        print("Loading knowledge base from markdown files...")
+    def initialize_onnx(self):
+        """Switch inference to ONNX Runtime if it stays within ONNX_MAX_DRIFT of the PyTorch embeddings"""
+        encoder = None
+        try:
+            if self.device != "cpu":
+                raise RuntimeError(f"ONNX Runtime backend is CPU only, model is on {self.device}")
+            path = OnnxEncoder.export(self.model, self.tokenizer, self.model_name,
+                                      quantize=self.inference_backend == "onnx-int8")
+            encoder = OnnxEncoder(path)
+            self.inference_parity = self.check_inference_parity(encoder)
+        except Exception as e:
+            self.inference_parity = {"error": str(e)}
+            print(f"⚠️ ONNX Runtime backend unavailable: {e}")
         
-        # Reset knowledge base
-        self.knowledge_base = []
-        
-        # Load all markdown files
-        markdown_files = [
-            'about.md',
-            'research_details.md', 
-            'publications_detailed.md',
-            'skills_expertise.md',
-            'experience_detailed.md',
-            'statistics.md'
+        if encoder is not None and self.inference_parity["max_drift"] <= ONNX_MAX_DRIFT:
+            self.onnx_encoder = encoder
+            print(f"✅ Using {self.inference_backend} inference (max cosine drift "
+                  f"{self.inference_parity['max_drift']:.5f}, {self.inference_parity['speedup']:.2f}x faster)")
+            return
+        
+        if encoder is not None:
+            print(f"⚠️ {self.inference_backend} embeddings drift {self.inference_parity['max_drift']:.5f} "
+                  f"(limit {ONNX_MAX_DRIFT}), keeping PyTorch so rankings do not change")
+        self.inference_backend = "torch"
+        self.pooling_config = self.pooling_config.split("|backend=")[0]
+    
+    def check_inference_parity(self, encoder: 'OnnxEncoder') -> Dict[str, Any]:
+        """Cosine drift and ranking agreement of ONNX against PyTorch embeddings on sample texts"""
+        sections = self.PARITY_PASSAGES + list(self.index.knowledge_base.contents[:32])
+        texts = self.PARITY_QUERIES + sections
+        
+        start_time = time.time()
+        reference = self._embed_batch_torch(texts)
+        torch_seconds = time.time() - start_time
+        start_time = time.time()
+        candidate = self._embed_batch_onnx(texts, encoder)
+        onnx_seconds = time.time() - start_time
+        
+        # Both sides are L2-normalised, so drift is 1 - cosine
+        drift = 1.0 - np.sum(reference * candidate, axis=1)
+        parity = {
+            "backend": self.inference_backend,
+            "samples": len(texts),
+            "mean_drift": float(drift.mean()),
+            "max_drift": float(drift.max()),
+            "torch_batch_ms": round(torch_seconds * 1000, 2),
+            "onnx_batch_ms": round(onnx_seconds * 1000, 2),
+            "speedup": torch_seconds / onnx_seconds if onnx_seconds > 0 else 0.0
+        }
+        
+        queries = len(self.PARITY_QUERIES)
+        k = min(5, len(sections))
+        overlap = [
+            len(set(top_k_indices(reference[queries:] @ reference[q], k).tolist()) &
+                set(top_k_indices(candidate[queries:] @ candidate[q], k).tolist())) / k
+            for q in range(queries)
         ]
+        parity[f"top_{k}_overlap"] = float(np.mean(overlap))
+        return parity
+    
+    def count_tokens(self, text: str) -> int:
+        """Number of model tokens in text, excluding special tokens"""
+        if self.inference_backend == "stub":
+            return StubEncoder.count_tokens(text)
+        if self.chunk_token_counter is None:
+            self.chunk_token_counter = load_chunk_token_counter(self.model_name)
+        return self.chunk_token_counter(text)
+    
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        """Embed one batch with attention-masked mean pooling and L2 normalisation"""
+        if self.inference_backend == "stub":
+            return StubEncoder.embed(texts)
+        if self.onnx_encoder is not None:
+            return self._embed_batch_onnx(texts, self.onnx_encoder)
+        return self._embed_batch_torch(texts)
+    
+    def _embed_batch_onnx(self, texts: List[str], encoder: 'OnnxEncoder') -> np.ndarray:
+        encoded = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.max_seq_length,
+            return_tensors="np"
+        )
+        token_embeddings = encoder({name: values.astype(np.int64) for name, values in encoded.items()})
         
-        for filename in markdown_files:
-            try:
-                if os.path.exists(filename):
-                    with open(filename, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                    self.process_markdown_file(content, filename)
-                    print(f"✅ Loaded {filename}")
-                else:
-                    print(f"⚠️ File not found: {filename}")
-            except Exception as e:
-                print(f"❌ Error loading {filename}: {e}")
+        mask = encoded["attention_mask"][..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        return pooled.astype(np.float32)
+    
+    def _embed_batch_torch(self, texts: List[str]) -> np.ndarray:
+        import torch
         
-        # Generate embeddings for knowledge base
-        print("Generating embeddings for knowledge base...")
-        self.embeddings = []
-        for i, doc in enumerate(self.knowledge_base):
+        encoded = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.max_seq_length,
+            return_tensors="pt"
+        ).to(self.device)
+        
+        with torch.inference_mode():
+            token_embeddings = self.model(**encoded).last_hidden_state
+        
+        # Mean over real tokens only, padding positions are masked out
+        mask = encoded["attention_mask"].unsqueeze(-1).to(token_embeddings.dtype)
+        pooled = (token_embeddings * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+        pooled = torch.nn.functional.normalize(pooled, p=2, dim=1)
+        return pooled.float().cpu().numpy()
+    
+    def embed_texts(self, texts: List[str], batch_size: int = None) -> np.ndarray:
+        """Embed texts in length-bucketed batches into one (len(texts), dim) float32 matrix"""
+        batch_size = batch_size or self.embedding_batch_size
+        matrix = np.zeros((len(texts), EMBEDDING_DIM), dtype=np.float32)
+        
+        # Sort by length so each batch pads to a similar sequence length
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        batches = [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+        
+        def run_batch(indices: List[int]):
             try:
-                # Truncate content to avoid token limit issues
-                content = doc["content"][:500]  # Limit to 500 characters
-                embedding = self.embedder(content, return_tensors="pt")
-                # Convert to numpy and flatten
-                embedding_np = embedding[0].mean(dim=0).detach().cpu().numpy()
-                self.embeddings.append(embedding_np)
+                matrix[indices] = self._embed_batch([texts[i] for i in indices])
             except Exception as e:
-                print(f"Error generating embedding for doc {doc['id']}: {e}")
-                # Fallback to zero embedding
-                self.embeddings.append(np.zeros(384))
+                # Rows stay zero, so failed texts simply never match
+                print(f"Error generating embeddings for batch of {len(indices)} texts: {e}")
+        
+        if self.embedding_workers > 1 and len(batches) > 1:
+            with ThreadPoolExecutor(max_workers=self.embedding_workers) as pool:
+                list(pool.map(run_batch, batches))
+        else:
+            for indices in batches:
+                run_batch(indices)
+        
+        return matrix
+    
+    def normalize_query(self, query: str) -> str:
+        """Collapse whitespace, and case when the tokenizer ignores it, so equivalent queries share cache entries"""
+        query = " ".join(query.split())
+        if getattr(self.tokenizer, "do_lower_case", False):
+            query = query.lower()
+        return query
+    
+    def embed_query(self, query: str) -> np.ndarray:
+        """Embed a single query into an L2-normalised float32 vector"""
+        key = self.normalize_query(query)
+        query_vector = self.query_embedding_cache.get(key)
+        if query_vector is None:
+            if self.query_batcher is not None:
+                query_vector = self.query_batcher.embed(key)
+            else:
+                query_vector = self.embed_texts([key])[0]
+            if not query_vector.any():
+                # embed_texts leaves the rows of a failed batch at zero; never cache or search with them
+                raise RuntimeError(f"Could not embed query '{key}'")
+            query_vector.flags.writeable = False  # shared between callers
+            self.query_embedding_cache.put(key, query_vector)
+        return query_vector
+    
+    def embed_documents(self, texts: List[str], live_texts: Iterable[str] = ()) -> np.ndarray:
+        """Embed knowledge base sections, reusing cached vectors for unchanged text.
+        
+        ``live_texts`` are other sections still in the corpus; their cache
+        entries are kept and marked as used.
+        """
+        if self.embedding_cache is None:
+            return self.embed_texts(texts)
+        
+        keys = [EmbeddingCache.make_key(self.model_name, text, self.pooling_config) for text in texts]
+        matrix, missing = self.embedding_cache.lookup(keys)
+        if missing:
+            matrix[missing] = self.embed_texts([texts[i] for i in missing])
+        
+        try:
+            live_keys = [EmbeddingCache.make_key(self.model_name, text, self.pooling_config) for text in live_texts]
+            self.embedding_cache.update(keys, matrix, live_keys)
+        except Exception as e:
+            print(f"⚠️ Could not write embedding cache: {e}")
+        
+        print(f"Embedding cache: {len(texts) - len(missing)} reused, {len(missing)} embedded")
+        return matrix
+    
+    def load_markdown_knowledge_base(self, embed: bool = True):
+        """Load knowledge base from markdown files and publish a freshly built index.
+        
+        With ``embed=False`` only the keyword index is built (fast start).
+        """
+        print("Loading knowledge base from markdown files...")
+        
+        with self.reload_lock:
+            index = IndexSnapshot()
+            document_terms = []
+            
+            for parsed in self.parse_markdown_files(self.list_markdown_files()):
+                for doc in parsed["documents"]:
+                    doc["id"] = f"{parsed['filename']}_{doc['metadata']['section']}_{len(index.knowledge_base)}"
+                    index.knowledge_base.append(doc)
+                document_terms.extend(parsed["term_counts"])
+                index.file_signatures[parsed["filename"]] = parsed["signature"]
+            
+            # Embedding is its own batched stage once every file is parsed
+            if embed:
+                self.attach_embeddings(index)
+            
+            self.build_bm25_index(index, document_terms)
+            self.publish_index(index)
         
-        self.total_documents = len(self.knowledge_base)
         print(f"✅ Knowledge base loaded with {len(self.knowledge_base)} documents")
     
-    def process_markdown_file(self, content: str, filename: str):
-        """Process a markdown file and extract sections"""
-        # Determine file type and priority
-        file_type_map = {
-            'about.md': ('about', 10),
-            'research_details.md': ('research', 9),
-            'publications_detailed.md': ('publications', 8),
-            'skills_expertise.md': ('skills', 7),
-            'experience_detailed.md': ('experience', 8),
-            'statistics.md': ('statistics', 9)
+    def list_markdown_files(self) -> List[str]:
+        """Configured markdown files plus those currently under the markdown directories"""
+        return find_markdown_files(self.markdown_files, self.markdown_directories)
+    
+    def parse_markdown_files(self, filenames: List[str]) -> Iterator[Dict[str, Any]]:
+        """Yield parse_markdown_file results in filename order, fanning out to worker processes when enabled"""
+        present = []
+        for filename in filenames:
+            if os.path.exists(filename):
+                present.append(filename)
+            else:
+                print(f"⚠️ File not found: {filename}")
+        
+        # Workers are forked so they never re-run this module; without fork the build stays serial
+        workers = min(self.build_workers, len(present))
+        pool = None
+        if workers > 1 and "fork" in multiprocessing.get_all_start_methods():
+            print(f"Parsing {len(present)} markdown files with {workers} processes...")
+            pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("fork"), initializer=init_build_worker,
+                initargs=(self.model_name, self.chunker.max_tokens, self.chunker.overlap_tokens, self.analyzer.stemming,
+                          self.inference_backend)
+            )
+            tasks = [pool.submit(parse_markdown_file, filename) for filename in present]
+        
+        try:
+            for position, filename in enumerate(present):
+                try:
+                    parsed = tasks[position].result() if pool is not None else \
+                        parse_markdown_file(filename, self.chunker, self.analyzer)
+                    print(f"✅ Loaded {filename}")
+                except Exception as e:
+                    print(f"❌ Error loading {filename}: {e}")
+                    continue
+                yield parsed
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+    
+    def attach_embeddings(self, index: IndexSnapshot):
+        """Embed an unpublished snapshot's sections and build its vector indexes"""
+        print("Generating embeddings for knowledge base...")
+        start_time = time.time()
+        index.embeddings = self.store_embeddings(
+            self.embed_documents(index.knowledge_base.contents)
+        )
+        index.vector_priority_boost = index.knowledge_base.priority_boost(100)
+        print(f"✅ Embeddings ready for {len(index.knowledge_base)} sections in {time.time() - start_time:.2f}s")
+        
+        index.vector_indexes = {ExactVectorIndex.name: ExactVectorIndex(index.embeddings)}
+        if self.vector_backend != ExactVectorIndex.name:
+            self.get_vector_index(index, self.vector_backend)
+    
+    def process_markdown_file(self, content: Iterable[str], filename: str, knowledge_base: List[Dict]):
+        """Process a markdown file (text or an iterable of lines) and append its chunks to knowledge_base"""
+        if isinstance(content, str):
+            content = content.splitlines()
+        
+        # Chunks stream straight from the file into the knowledge base
+        for doc in markdown_documents(content, filename, self.chunker):
+            doc["id"] = f"{filename}_{doc['metadata']['section']}_{len(knowledge_base)}"
+            knowledge_base.append(doc)
+    
+    def artifact_build_info(self) -> Dict[str, Any]:
+        """Build parameters an index artifact must match to be usable by this bot"""
+        return {
+            "model_name": self.model_name,
+            "pooling_config": self.pooling_config,
+            "embedding_dim": EMBEDDING_DIM,
+            "bm25_k1": self.k1,
+            "bm25_b": self.b,
+            "bm25_analyzer": self.analyzer.config
         }
+    
+    def save_index_artifact(self, path: str):
+        """Write the published snapshot to a memory-mappable index artifact"""
+        start_time = time.time()
+        IndexArtifact.write(path, self.index, self.artifact_build_info())
+        print(f"✅ Index artifact written to {path} ({os.path.getsize(path) / 1e6:.1f} MB) in {time.time() - start_time:.2f}s")
+    
+    def load_index_artifact(self, path: str, verify: bool = True) -> bool:
+        """Publish the snapshot stored in an index artifact; returns False if it is refused"""
+        print(f"Loading index artifact {path}...")
+        start_time = time.time()
+        index = self.open_index_artifact(path, verify)
+        if index is None:
+            return False
+        with self.reload_lock:
+            self.publish_index(index)
+        print(f"✅ Index artifact loaded with {len(index.knowledge_base)} documents in {time.time() - start_time:.2f}s")
+        return True
+    
+    def open_index_artifact(self, path: str, verify: bool = True) -> IndexSnapshot:
+        """Map an index artifact into a searchable snapshot without publishing it; None if it is refused"""
+        try:
+            index = IndexArtifact.read(path, self.artifact_build_info(), verify=verify)
+        except Exception as e:
+            print(f"❌ Refusing index artifact {path}: {e}")
+            return None
         
-        file_type, priority = file_type_map.get(filename, ('general', 5))
-        
-        # Split content into sections
-        sections = self.split_markdown_into_sections(content)
-        
-        for section in sections:
-            if len(section['content'].strip()) > 100:  # Only process substantial content
-                doc = {
-                    "id": f"{filename}_{section['title']}_{len(self.knowledge_base)}",
-                    "content": section['content'],
-                    "metadata": {
-                        "type": file_type,
-                        "priority": priority,
-                        "section": section['title'],
-                        "source": filename
-                    }
-                }
-                self.knowledge_base.append(doc)
+        # Term ids in the artifact are the analyzer's ids from when it was built. An artifact from another
+        # build (e.g. a restarted primary) may number terms differently, so it gets an analyzer of its own
+        # and the published snapshot keeps tokenizing queries with the ids it was built with.
+        analyzer = self.analyzer
+        if analyzer.terms != index.terms[:len(analyzer.terms)]:
+            analyzer = TextAnalyzer(analyzer.stemming)
+        analyzer.load_vocabulary(index.terms)
+        index.analyzer = analyzer
+        index.vector_priority_boost = index.knowledge_base.priority_boost(100)
+        index.bm25_priority_boost = index.knowledge_base.priority_boost(50)
+        # Stored ANN indexes are mapped, not rebuilt, unless this process quantizes differently
+        stored = index.vector_indexes
+        if QuantizedVectorIndex.name in stored and stored[QuantizedVectorIndex.name].dtype != QUANTIZATION:
+            del stored[QuantizedVectorIndex.name]
+        index.vector_indexes = {ExactVectorIndex.name: ExactVectorIndex(index.embeddings), **stored}
+        if self.vector_backend != ExactVectorIndex.name:
+            self.get_vector_index(index, self.vector_backend)
+        return index
     
-    def split_markdown_into_sections(self, content: str) -> List[Dict[str, str]]:
-        """Split markdown content into sections based on headers"""
-        sections = []
-        lines = content.split('\n')
-        current_section = {'title': 'Introduction', 'content': ''}
+    def share_index(self):
+        """Primary: publish the current snapshot as the next shared generation and serve from its mapping.
         
-        for line in lines:
-            # Check if line is a header
-            if line.startswith('#'):
-                # Save previous section if it has content
-                if current_section['content'].strip():
-                    sections.append(current_section.copy())
+        Re-opening the artifact swaps this process's private index arrays for
+        the shared pages, so primary and workers search the same memory.
+        """
+        if self.shared_index is None or self.serving_role != "primary":
+            return
+        start_time = time.time()
+        try:
+            with self.reload_lock:
+                # Build the default ANN index here so it is published with the generation
+                self.get_vector_index(self.index, self.vector_backend)
+                record = self.shared_index.publish(self.save_index_artifact)
+                index = self.open_index_artifact(record["path"], verify=False)
+                if index is not None:
+                    self.publish_index(index)
+                self.shared_generation = record["generation"]
+            print(f"📤 Shared index generation {record['generation']} published in {time.time() - start_time:.2f}s")
+        except Exception as e:
+            metrics.increment("rag_errors_total", component="share_index")
+            print(f"❌ Could not publish shared index: {e}")
+    
+    def attach_shared_index(self) -> bool:
+        """Worker: map the current shared generation instead of building an index, then follow new ones"""
+        print(f"Waiting for a shared index generation in {self.shared_index.directory}...")
+        record = self.shared_index.wait(SHARED_INDEX_TIMEOUT)
+        if record is None:
+            raise RuntimeError(f"No shared index generation was published in {self.shared_index.directory} "
+                               f"within {SHARED_INDEX_TIMEOUT:.0f}s")
+        # The primary may unlink a generation between reading the pointer and mapping it; retry with the newest
+        for attempt in range(3):
+            if self.load_index_artifact(record["path"], verify=False):
+                self.shared_generation = record["generation"]
+                self.follow_generations()
+                return True
+            time.sleep(GENERATION_POLL_INTERVAL)
+            record = self.shared_index.current() or record
+        raise RuntimeError(f"Could not attach shared index generation {record['generation']}")
+    
+    def follow_generations(self, interval: float = GENERATION_POLL_INTERVAL):
+        """Worker: poll the generation pointer and map each new generation as the primary publishes it"""
+        if self.generation_follower is not None:
+            return
+        
+        def follow():
+            while True:
+                time.sleep(interval)
+                record = self.shared_index.current()
+                if record is None or record["generation"] == self.shared_generation:
+                    continue
+                try:
+                    if self.load_index_artifact(record["path"], verify=False):
+                        self.shared_generation = record["generation"]
+                        print(f"📥 Now serving shared index generation {record['generation']}")
+                except Exception as e:
+                    print(f"❌ Error attaching shared index generation {record['generation']}: {e}")
+        
+        self.generation_follower = threading.Thread(target=follow, name="generation-follower", daemon=True)
+        self.generation_follower.start()
+    
+    def get_serving_stats(self) -> Dict[str, Any]:
+        """Process role and the shared generation it serves"""
+        latest = self.shared_index.current() if self.shared_index is not None else None
+        return {
+            "role": self.serving_role,
+            "pid": os.getpid(),
+            "shared_index_dir": self.shared_index.directory if self.shared_index is not None else None,
+            "generation": self.shared_generation,
+            "latest_generation": latest["generation"] if latest else None
+        }
+    
+    def reload_knowledge_base(self) -> Dict[str, Any]:
+        """Incrementally reload changed markdown files and atomically publish the new index.
+        
+        Sections whose file is unchanged, or whose title and content still match,
+        keep their embedding and postings; only new or edited sections are
+        tokenized and embedded.
+        """
+        # Workers never build; they pick up the primary's next shared generation
+        if self.serving_role == "worker":
+            return {"changed_files": [], "added_sections": 0, "removed_sections": 0, "version": self.index.version,
+                    "skipped": "worker"}
+        # During fast start the model is still loading; the watcher retries on its next poll
+        if not self.models_ready.is_set():
+            return {"changed_files": [], "added_sections": 0, "removed_sections": 0, "version": self.index.version,
+                    "skipped": self.status}
+        with self.reload_lock:
+            old = self.index
+            index = IndexSnapshot()
+            old_to_new = np.full(len(old.knowledge_base), -1, dtype=np.int64)
+            added = []  # new doc indices that need embedding and tokenizing
+            changed_files = []
+            
+            old_by_file = defaultdict(list)
+            for old_index, source in enumerate(old.knowledge_base.sources):
+                old_by_file[source].append(old_index)
+            
+            for filename in self.list_markdown_files():
+                file_docs = []
+                try:
+                    if not os.path.exists(filename):
+                        continue
+                    signature = file_signature(filename)
+                    if signature == old.file_signatures.get(filename):
+                        # Unchanged file: carry its sections and rows over without chunking it again
+                        index.file_signatures[filename] = signature
+                        for old_index in old_by_file.get(filename, []):
+                            doc = old.knowledge_base[old_index]
+                            new_index = len(index.knowledge_base)
+                            doc['id'] = f"{filename}_{doc['metadata']['section']}_{new_index}"
+                            old_to_new[old_index] = new_index
+                            index.knowledge_base.append(doc)
+                        continue
+                    digest = hashlib.sha256()
+                    self.process_markdown_file(stream_lines(filename, digest), filename, file_docs)
+                except Exception as e:
+                    print(f"❌ Error loading {filename}: {e}")
+                    continue
                 
-                # Start new section
-                header_level = len(line) - len(line.lstrip('#'))
-                title = line.lstrip('#').strip()
-                current_section = {
-                    'title': title,
-                    'content': line + '\n'
-                }
-            else:
-                current_section['content'] += line + '\n'
+                signature = digest.hexdigest()
+                index.file_signatures[filename] = signature
+                if old.file_signatures.get(filename) != signature:
+                    changed_files.append(filename)
+                
+                # Match sections against the previous build of the same file
+                previous = defaultdict(list)
+                for old_index in old_by_file.get(filename, []):
+                    previous[(old.knowledge_base.sections[old_index], old.knowledge_base.contents[old_index])].append(old_index)
+                
+                for doc in file_docs:
+                    new_index = len(index.knowledge_base)
+                    doc['id'] = f"{filename}_{doc['metadata']['section']}_{new_index}"
+                    matches = previous.get((doc['metadata']['section'], doc['content']))
+                    if matches:
+                        old_to_new[matches.pop(0)] = new_index
+                    else:
+                        added.append(new_index)
+                    index.knowledge_base.append(doc)
+            
+            removed = int((old_to_new < 0).sum())
+            if not changed_files and not added and not removed and len(index.knowledge_base) == len(old.knowledge_base):
+                return {"changed_files": [], "added_sections": 0, "removed_sections": 0, "version": old.version}
+            
+            print(f"Reloading {len(changed_files)} changed files: {len(added)} new sections, {removed} removed")
+            
+            # Reuse embeddings of unchanged sections, embed only the new ones
+            index.embeddings = np.zeros((len(index.knowledge_base), EMBEDDING_DIM), dtype=np.float32)
+            kept = np.flatnonzero(old_to_new >= 0)
+            index.embeddings[old_to_new[kept]] = old.embeddings[kept]
+            # Every section still in the corpus counts as used, so a reload never ages the cache out
+            index.embeddings[added] = self.embed_documents([index.knowledge_base.contents[i] for i in added],
+                                                           live_texts=index.knowledge_base.contents)
+            index.embeddings = self.store_embeddings(index.embeddings)
+            index.vector_priority_boost = index.knowledge_base.priority_boost(100)
+            # Built ANN indexes keep their trained structure; new rows are inserted incrementally
+            index.vector_indexes = {
+                name: vector_index.remap(index.embeddings, old_to_new, added)
+                for name, vector_index in old.vector_indexes.items()
+            }
+            
+            self.update_bm25_index(index, old, old_to_new, added)
+            self.publish_index(index)
+        
+        print(f"✅ Knowledge base reloaded with {len(index.knowledge_base)} documents (index version {index.version})")
+        self.share_index()
+        return {
+            "changed_files": changed_files,
+            "added_sections": len(added),
+            "removed_sections": removed,
+            "version": index.version
+        }
+    
+    def start_watcher(self, interval: float = 2.0):
+        """Poll the markdown files and reload whenever one of them changes"""
+        if self.watcher is not None:
+            return
+        
+        def file_state():
+            state = {}
+            for filename in self.list_markdown_files():
+                try:
+                    stat = os.stat(filename)
+                    state[filename] = (stat.st_mtime_ns, stat.st_size)
+                except OSError:
+                    state[filename] = None
+            return state
         
-        # Add the last section
-        if current_section['content'].strip():
-            sections.append(current_section)
+        def watch():
+            last_state = file_state()
+            while True:
+                time.sleep(interval)
+                state = file_state()
+                if state != last_state:
+                    # Only a reload that ran and succeeded consumes the change; skipped or failed ones retry next poll
+                    try:
+                        if "skipped" not in self.reload_knowledge_base():
+                            last_state = state
+                    except Exception as e:
+                        print(f"❌ Error reloading knowledge base: {e}")
         
-        return sections
+        self.watcher = threading.Thread(target=watch, name="markdown-watcher", daemon=True)
+        self.watcher.start()
+        print(f"👀 Watching {len(self.list_markdown_files())} markdown files for changes every {interval}s")
+    
+    def split_markdown_into_sections(self, content: str) -> List[Dict[str, Any]]:
+        """Split markdown content into header-scoped, token-budgeted chunks"""
+        return list(self.chunker.chunks(content.splitlines()))
     
     def tokenize(self, text: str) -> List[str]:
         """Tokenize text for BM25"""
-        # Convert to lowercase and remove punctuation
-        text = re.sub(r'[^\w\s]', ' ', text.lower())
-        # Split into words and filter out short words and stop words
-        words = [word for word in text.split() if len(word) > 2 and not self.is_stop_word(word)]
-        return words
+        return self.analyzer.analyze(text)
     
     def is_stop_word(self, word: str) -> bool:
         """Check if word is a stop word"""
-        stop_words = {
-            'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by',
-            'is', 'are', 'was', 'were', 'be', 'been', 'being', 'have', 'has', 'had', 'do', 'does', 'did',
-            'will', 'would', 'could', 'should', 'may', 'might', 'can', 'this', 'that', 'these', 'those',
-            'from', 'up', 'out', 'down', 'off', 'over', 'under', 'again', 'further', 'then', 'once'
-        }
-        return word in stop_words
+        return word in TextAnalyzer.STOP_WORDS
     
-    def build_bm25_index(self):
-        """Build BM25 index for all documents"""
+    def build_bm25_index(self, index: IndexSnapshot = None, document_terms: List[List[tuple]] = None):
+        """Build BM25 inverted index for all documents.
+        
+        Without ``index``, the published documents are re-indexed into a new
+        snapshot which is then published. ``document_terms`` holds each
+        document's (term, frequency) pairs when the build already analyzed
+        them (see parse_markdown_file).
+        """
+        publish = index is None
+        if publish:
+            index = self.index.copy_documents()
+        
         print("Building BM25 index...")
         
-        # Reset indexes
-        self.term_frequencies = {}
-        self.document_frequency = defaultdict(int)
-        self.document_lengths = {}
+        postings = defaultdict(lambda: ([], []))
+        document_lengths = np.zeros(len(index.knowledge_base), dtype=np.int32)
         
-        total_length = 0
+        # Single pass: posting lists are appended in doc order, so doc indices stay sorted
+        for doc_index, content in enumerate(index.knowledge_base.contents):
+            if document_terms is not None:
+                # Merge analyzed terms in document order, so term ids match a serial build
+                term_counts = [(self.analyzer.add_term(term), frequency) for term, frequency in document_terms[doc_index]]
+            else:
+                term_counts = Counter(self.analyzer.term_ids(content, add=True)).items()
+            document_lengths[doc_index] = sum(frequency for _, frequency in term_counts)
+            for term_id, frequency in term_counts:
+                doc_indices, frequencies = postings[term_id]
+                doc_indices.append(doc_index)
+                frequencies.append(frequency)
         
-        # First pass: calculate term frequencies and document lengths
-        for doc in self.knowledge_base:
-            doc_id = doc['id']
-            terms = self.tokenize(doc['content'])
-            
-            # Calculate term frequencies for this document
-            term_freq = Counter(terms)
-            self.term_frequencies[doc_id] = dict(term_freq)
-            
-            # Store document length
-            doc_length = len(terms)
-            self.document_lengths[doc_id] = doc_length
-            total_length += doc_length
-            
-            # Update document frequencies
-            unique_terms = set(terms)
-            for term in unique_terms:
-                self.document_frequency[term] += 1
+        index.postings = {
+            term_id: (np.array(doc_indices, dtype=np.int32), np.array(frequencies, dtype=np.float32))
+            for term_id, (doc_indices, frequencies) in postings.items()
+        }
+        index.document_lengths = document_lengths
+        self.compute_bm25_weights(index)
         
-        # Calculate average document length
-        self.average_doc_length = total_length / self.total_documents if self.total_documents > 0 else 0
+        if publish:
+            self.publish_index(index)
         
-        print(f"✅ BM25 index built: {len(self.document_frequency)} unique terms, avg doc length: {self.average_doc_length:.1f}")
+        print(f"✅ BM25 index built: {len(index.document_frequency)} unique terms, avg doc length: {index.average_doc_length:.1f}")
     
-    def calculate_bm25_score(self, term: str, doc_id: str) -> float:
-        """Calculate BM25 score for a term in a document"""
-        # Get term frequency in document
-        tf = self.term_frequencies.get(doc_id, {}).get(term, 0)
-        if tf == 0:
-            return 0.0
+    def update_bm25_index(self, index: IndexSnapshot, old: IndexSnapshot, old_to_new: np.ndarray, added: List[int]):
+        """Derive index's BM25 state from old by remapping kept postings and adding new sections"""
+        document_lengths = np.zeros(len(index.knowledge_base), dtype=np.int32)
+        kept = np.flatnonzero(old_to_new >= 0)
+        document_lengths[old_to_new[kept]] = old.document_lengths[kept]
+        
+        # Only new or edited sections are tokenized
+        added_postings = defaultdict(lambda: ([], []))
+        for doc_index in added:
+            term_ids = self.analyzer.term_ids(index.knowledge_base.contents[doc_index], add=True)
+            document_lengths[doc_index] = len(term_ids)
+            for term_id, frequency in Counter(term_ids).items():
+                doc_indices, frequencies = added_postings[term_id]
+                doc_indices.append(doc_index)
+                frequencies.append(frequency)
         
-        # Get document frequency and document length
-        df = self.document_frequency.get(term, 1)
-        doc_length = self.document_lengths.get(doc_id, 0)
+        postings = {}
+        for term_id, (doc_indices, frequencies) in old.postings.items():
+            mapped = old_to_new[doc_indices]
+            keep = mapped >= 0
+            doc_indices, frequencies = mapped[keep].astype(np.int32), frequencies[keep]
+            if term_id in added_postings:
+                new_indices, new_frequencies = added_postings.pop(term_id)
+                doc_indices = np.concatenate([doc_indices, np.array(new_indices, dtype=np.int32)])
+                frequencies = np.concatenate([frequencies, np.array(new_frequencies, dtype=np.float32)])
+            if len(doc_indices) == 0:
+                continue  # term no longer occurs anywhere
+            order = np.argsort(doc_indices, kind="stable")
+            postings[term_id] = (doc_indices[order], frequencies[order])
+        for term_id, (doc_indices, frequencies) in added_postings.items():
+            postings[term_id] = (np.array(doc_indices, dtype=np.int32), np.array(frequencies, dtype=np.float32))
         
-        # Calculate IDF: log((N - df + 0.5) / (df + 0.5))
-        idf = math.log((self.total_documents - df + 0.5) / (df + 0.5))
+        index.postings = postings
+        index.document_lengths = document_lengths
+        # N and the average length changed, so every IDF and posting weight is refreshed
+        self.compute_bm25_weights(index)
+    
+    def compute_bm25_weights(self, index: IndexSnapshot):
+        """Precompute IDF and the length-normalised BM25 weight of every posting"""
+        index.total_documents = len(index.document_lengths)
+        index.average_doc_length = float(index.document_lengths.mean()) if index.total_documents > 0 else 0
+        index.bm25_priority_boost = index.knowledge_base.priority_boost(50)
+        index.build_metadata_codes()
+        
+        # Per-document denominator term: k1 * (1 - b + b * dl / avgdl)
+        average_length = index.average_doc_length or 1.0
+        length_norm = (self.k1 * (1 - self.b + self.b * (index.document_lengths / average_length))).astype(np.float32)
         
-        # Calculate BM25 score
-        numerator = tf * (self.k1 + 1)
-        denominator = tf + self.k1 * (1 - self.b + self.b * (doc_length / self.average_doc_length))
+        index.document_frequency = {}
+        index.idf = {}
+        index.posting_weights = {}
+        index.term_upper_bounds = {}
+        index.term_lower_bounds = {}
+        for term_id, (doc_indices, frequencies) in index.postings.items():
+            df = len(doc_indices)
+            # IDF: log((N - df + 0.5) / (df + 0.5))
+            idf = math.log((index.total_documents - df + 0.5) / (df + 0.5))
+            weights = (idf * frequencies * (self.k1 + 1) / (frequencies + length_norm[doc_indices])).astype(np.float32)
+            
+            index.document_frequency[term_id] = df
+            index.idf[term_id] = idf
+            index.posting_weights[term_id] = weights
+            index.term_upper_bounds[term_id] = max(float(weights.max()), 0.0)
+            index.term_lower_bounds[term_id] = min(float(weights.min()), 0.0)
         
-        return idf * (numerator / denominator)
+        # Snapshot of the vocabulary the term ids refer to
+        index.terms = list(self.analyzer.terms)
+        index.analyzer = self.analyzer
+        self.build_bm25_matrix(index)
     
-    def bm25_search(self, query: str, top_k: int = 10) -> List[Dict]:
-        """Perform BM25 search"""
-        query_terms = self.tokenize(query)
-        if not query_terms:
-            return []
+    def build_bm25_matrix(self, index: IndexSnapshot):
+        """Pack the posting weights into a CSR term-document matrix for batch scoring"""
+        if sparse is None:
+            index.bm25_matrix = None
+            return
         
-        scores = {}
+        # Row = term id; each posting list is already one sorted CSR row
+        term_ids = sorted(index.postings)
+        lengths = np.zeros(len(index.terms), dtype=np.int64)
+        lengths[term_ids] = [len(index.postings[term_id][0]) for term_id in term_ids]
+        indptr = np.zeros(len(index.terms) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(lengths)
+        indices = np.concatenate([index.postings[term_id][0] for term_id in term_ids]) if term_ids else np.zeros(0, dtype=np.int32)
+        data = np.concatenate([index.posting_weights[term_id] for term_id in term_ids]) if term_ids else np.zeros(0, dtype=np.float32)
+        index.bm25_matrix = sparse.csr_matrix((data, indices, indptr), shape=(len(index.terms), index.total_documents))
+    
+    def bm25_scores(self, index: IndexSnapshot, query_term_ids: List[int], top_k: int = None,
+                    allowed: np.ndarray = None) -> (np.ndarray, np.ndarray):
+        """Accumulate raw BM25 scores over the postings of the query terms.
+        
+        Returns candidate doc indices and their raw scores. With ``top_k`` set,
+        max-score pruning drops documents that can no longer reach the top-k.
+        With an ``allowed`` mask, postings of other documents are dropped
+        before they are scored.
+        """
+        # Repeated query terms count once per occurrence, as in the per-term sum
+        query_counts = [(term_id, count) for term_id, count in Counter(query_term_ids).items() if term_id in index.postings]
+        scores = np.zeros(index.total_documents, dtype=np.float64)
+        touched = np.zeros(index.total_documents, dtype=bool)
+        
+        def postings(term_id):
+            doc_indices, weights = index.postings[term_id][0], index.posting_weights[term_id]
+            if allowed is None:
+                return doc_indices, weights
+            keep = allowed[doc_indices]
+            return doc_indices[keep], weights[keep]
+        
+        if top_k is None:
+            for term_id, count in query_counts:
+                doc_indices, weights = postings(term_id)
+                scores[doc_indices] += count * weights
+                touched[doc_indices] = True
+            candidates = np.flatnonzero(touched)
+            return candidates, scores[candidates]
         
-        # Calculate BM25 score for each document
-        for doc in self.knowledge_base:
-            doc_id = doc['id']
-            score = 0.0
+        # Max-score: visit terms by decreasing upper bound; once the k-th best score beats
+        # anything the remaining terms could add, only known candidates are scored further
+        query_counts.sort(key=lambda item: item[1] * index.term_upper_bounds[item[0]], reverse=True)
+        remaining_upper = np.cumsum([count * index.term_upper_bounds[term_id] for term_id, count in query_counts][::-1])[::-1]
+        remaining_lower = np.cumsum([count * index.term_lower_bounds[term_id] for term_id, count in query_counts][::-1])[::-1]
+        max_boost = float(index.bm25_priority_boost.max()) if index.total_documents else 1.0
+        candidates = None
+        
+        for position, (term_id, count) in enumerate(query_counts):
+            doc_indices, weights = postings(term_id)
+            weights = count * weights
             
-            for term in query_terms:
-                score += self.calculate_bm25_score(term, doc_id)
+            if candidates is None:
+                scores[doc_indices] += weights
+                touched[doc_indices] = True
+            else:
+                # Look up candidates in the sorted posting list instead of walking all of it
+                found = np.searchsorted(doc_indices, candidates)
+                in_list = found < len(doc_indices)
+                in_list[in_list] = doc_indices[found[in_list]] == candidates[in_list]
+                scores[candidates[in_list]] += weights[found[in_list]]
             
-            if score > 0:
-                # Apply priority boost
-                priority_boost = 1 + (doc['metadata']['priority'] / 50)
-                final_score = score * priority_boost
-                
-                scores[doc_id] = {
-                    'document': doc,
-                    'score': final_score,
-                    'search_type': 'bm25'
-                }
+            last = position + 1 == len(query_counts)
+            rest_upper = 0.0 if last else remaining_upper[position + 1]
+            rest_lower = 0.0 if last else remaining_lower[position + 1]
+            pool = np.flatnonzero(touched) if candidates is None else candidates
+            if len(pool) < top_k:
+                continue
+            # The k-th best guaranteed score is a safe threshold for the final top-k
+            guaranteed = (scores[pool] + rest_lower) * index.bm25_priority_boost[pool]
+            threshold = np.partition(guaranteed, len(pool) - top_k)[len(pool) - top_k]
+            if candidates is None and threshold <= rest_upper * max_boost:
+                continue
+            # Keep only documents whose best possible final score can still reach the threshold
+            candidates = pool[(scores[pool] + rest_upper) * index.bm25_priority_boost[pool] >= threshold]
         
-        # Sort by score and return top_k
-        sorted_results = sorted(scores.values(), key=lambda x: x['score'], reverse=True)
-        return sorted_results[:top_k]
+        if candidates is None:
+            candidates = np.flatnonzero(touched)
+        return candidates, scores[candidates]
     
-    def cosine_similarity(self, a, b):
-        """Calculate cosine similarity between two vectors"""
-        return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
+    def bm25_search(self, query: str, top_k: int = 10, max_score: bool = None, index: IndexSnapshot = None,
+                    filters: Dict[str, Any] = None) -> List[Dict]:
+        """Perform BM25 search, restricted to documents matching ``filters`` (see parse_filters)"""
+        index = index or self.index
+        allowed = index.filter_mask(parse_filters(filters))
+        return self.bm25_results(index, *self.bm25_ranked(index, query, top_k, max_score, allowed))
     
-    def vector_search(self, query: str, top_k: int = 10) -> List[Dict]:
-        """Perform vector similarity search"""
+    def bm25_ranked(self, index: IndexSnapshot, query: str, top_k: int, max_score: bool = None,
+                    allowed: np.ndarray = None) -> (np.ndarray, np.ndarray):
+        """Top-k BM25 doc indices and boosted scores, best first"""
+        with metrics.stage("bm25_analyze"):
+            query_term_ids = (index.analyzer or self.analyzer).term_ids(query)
+        if not query_term_ids or index.total_documents == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        
+        use_max_score = self.bm25_max_score if max_score is None else max_score
+        with metrics.stage("bm25_score"):
+            candidates, raw_scores = self.bm25_scores(index, query_term_ids, top_k if use_max_score else None, allowed)
+            return self.bm25_rank(index, candidates, raw_scores, top_k)
+    
+    def bm25_rank(self, index: IndexSnapshot, candidates: np.ndarray, raw_scores: np.ndarray, top_k: int) -> (np.ndarray, np.ndarray):
+        """Rank candidate doc indices by boosted BM25 score"""
+        # Only documents with a positive score are returned; apply priority boost
+        positive = raw_scores > 0
+        candidates = candidates[positive]
+        final_scores = raw_scores[positive] * index.bm25_priority_boost[candidates]
+        winners = top_k_indices(final_scores, top_k)
+        return candidates[winners], final_scores[winners]
+    
+    def bm25_results(self, index: IndexSnapshot, doc_indices: np.ndarray, scores: np.ndarray) -> List[Dict]:
+        """Turn ranked doc indices and BM25 scores into result dicts"""
+        return [
+            {
+                'document': index.knowledge_base[doc_index],
+                'score': float(score),
+                'search_type': 'bm25'
+            }
+            for doc_index, score in zip(doc_indices, scores)
+        ]
+    
+    def bm25_search_batch(self, queries: List[str], top_k: int = 10, index: IndexSnapshot = None,
+                          filters: Dict[str, Any] = None) -> List[List[Dict]]:
+        """Perform BM25 search for many queries with one sparse matrix product"""
+        index = index or self.index
+        if index.bm25_matrix is None or index.total_documents == 0:
+            return [self.bm25_search(query, top_k, index=index, filters=filters) for query in queries]
+        allowed = index.filter_mask(parse_filters(filters))
+        
+        # Sparse (queries x term ids) matrix of query term counts
+        rows, columns, counts = [], [], []
+        vocabulary_size = index.bm25_matrix.shape[0]
+        analyzer = index.analyzer or self.analyzer
+        with metrics.stage("bm25_analyze"):
+            for row, query in enumerate(queries):
+                for term_id, count in Counter(analyzer.term_ids(query)).items():
+                    if term_id < vocabulary_size:  # terms added by a newer build are not in this snapshot
+                        rows.append(row)
+                        columns.append(term_id)
+                        counts.append(count)
+        query_matrix = sparse.csr_matrix(
+            (np.array(counts, dtype=np.float64), (rows, columns)),
+            shape=(len(queries), vocabulary_size)
+        )
+        
+        # Filtered batches only score the matrix columns of allowed documents
+        rows = np.flatnonzero(allowed) if allowed is not None else None
+        with metrics.stage("bm25_score"):
+            matrix = index.bm25_matrix if rows is None else index.bm25_matrix[:, rows]
+            scores = (query_matrix @ matrix).tocsr()
+            scores.sort_indices()
+            ranked = []
+            for row in range(len(queries)):
+                start, end = scores.indptr[row], scores.indptr[row + 1]
+                candidates = scores.indices[start:end] if rows is None else rows[scores.indices[start:end]]
+                ranked.append(self.bm25_rank(index, candidates, scores.data[start:end], top_k))
+        return [self.bm25_results(index, *doc_scores) for doc_scores in ranked]
+    
+    def store_embeddings(self, embeddings: np.ndarray) -> np.ndarray:
+        """Keep full-precision embeddings in memory, or memory-map them when a compressed storage is configured"""
+        if EMBEDDING_STORAGE == "float32" or not VECTOR_INDEX_DIR:
+            return embeddings
+        
+        os.makedirs(VECTOR_INDEX_DIR, exist_ok=True)
+        filename = f"full_embeddings_{IVFVectorIndex.fingerprint(embeddings)[:16]}.npy"
+        path = os.path.join(VECTOR_INDEX_DIR, filename)
+        if not os.path.exists(path):
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, embeddings)
+            os.replace(tmp_path, path)
+        
+        # Older spill files belong to replaced snapshots; open maps keep working after unlink
+        for other in os.listdir(VECTOR_INDEX_DIR):
+            if other.startswith("full_embeddings_") and other != filename:
+                try:
+                    os.remove(os.path.join(VECTOR_INDEX_DIR, other))
+                except OSError:
+                    pass
+        return np.load(path, mmap_mode="r")
+    
+    def get_vector_index(self, index: IndexSnapshot, backend: str = None):
+        """Return the snapshot's vector index for ``backend``, building it on first use"""
+        backend = backend or self.vector_backend
+        vector_index = index.vector_indexes.get(backend)
+        if vector_index is not None:
+            return vector_index
+        if backend not in VECTOR_INDEX_BACKENDS:
+            raise ValueError(f"Unknown vector backend '{backend}', expected one of {list(VECTOR_INDEX_BACKENDS)}")
+        
+        with self.vector_index_lock:
+            vector_index = index.vector_indexes.get(backend)
+            if vector_index is None:
+                vector_index = self.build_vector_index(index.embeddings, backend)
+                # Copy-on-write so concurrent readers never see the dict change size
+                index.vector_indexes = {**index.vector_indexes, backend: vector_index}
+        return vector_index
+    
+    def build_vector_index(self, embeddings: np.ndarray, backend: str):
+        """Build (or load from disk) a vector index over the embedding matrix"""
+        if backend == ExactVectorIndex.name:
+            return ExactVectorIndex(embeddings)
+        if backend == QuantizedVectorIndex.name:
+            vector_index = QuantizedVectorIndex.build(embeddings, QUANTIZATION)
+            print(f"✅ {QUANTIZATION} vector index built for {len(vector_index.codes)} vectors")
+            return vector_index
+        
+        path = os.path.join(VECTOR_INDEX_DIR, f"{backend}_index.npz") if VECTOR_INDEX_DIR else None
+        if path:
+            try:
+                vector_index = IVFVectorIndex.load(path, embeddings, IVF_NPROBE)
+                if vector_index is not None:
+                    print(f"✅ Loaded {backend} vector index from {path}")
+                    return vector_index
+            except Exception as e:
+                print(f"⚠️ Could not read vector index {path}: {e}")
+        
+        print(f"Building {backend} vector index...")
+        start_time = time.time()
+        vector_index = IVFVectorIndex.build(embeddings, nlist=IVF_NLIST or None, nprobe=IVF_NPROBE)
+        print(f"✅ {backend} vector index built with {len(vector_index.centroids)} lists in {time.time() - start_time:.2f}s")
+        if path:
+            try:
+                vector_index.save(path)
+            except Exception as e:
+                print(f"⚠️ Could not write vector index {path}: {e}")
+        return vector_index
+    
+    def vector_search(self, query: str, top_k: int = 10, index: IndexSnapshot = None, backend: str = None,
+                      filters: Dict[str, Any] = None) -> List[Dict]:
+        """Perform vector similarity search, restricted to documents matching ``filters`` (see parse_filters)"""
+        index = index or self.index
+        if not self.models_ready.is_set():
+            # Fast start: the model is still loading in the background
+            metrics.increment("rag_fallbacks_total", kind="vector_warm_up")
+            return []
         try:
-            # Generate query embedding
-            query_embedding = self.embedder(query[:500], return_tensors="pt")  # Truncate query
-            query_vector = query_embedding[0].mean(dim=0).detach().cpu().numpy()
+            winners, scores = self.vector_ranked(index, query, top_k, backend,
+                                                 index.filter_mask(parse_filters(filters)))
             
-            # Calculate similarities
-            similarities = []
-            for i, doc_embedding in enumerate(self.embeddings):
-                if doc_embedding is not None and len(doc_embedding) > 0:
-                    similarity = self.cosine_similarity(query_vector, doc_embedding)
-                    
-                    # Apply priority boost
-                    priority_boost = 1 + (self.knowledge_base[i]['metadata']['priority'] / 100)
-                    final_score = similarity * priority_boost
-                    
-                    similarities.append({
-                        'document': self.knowledge_base[i],
-                        'score': float(final_score),
-                        'search_type': 'vector'
-                    })
-            
-            # Sort by similarity and return top_k
-            similarities.sort(key=lambda x: x['score'], reverse=True)
-            return similarities[:top_k]
+            return [
+                {
+                    'document': index.knowledge_base[doc_index],
+                    'score': float(score),
+                    'search_type': 'vector'
+                }
+                for doc_index, score in zip(winners, scores)
+            ]
             
         except Exception as e:
-            print(f"Error in vector search: {e}")
+            self.record_search_error("vector_search", e)
             return []
     
-    def hybrid_search(self, query: str, top_k: int = 10, vector_weight: float = 0.6, bm25_weight: float = 0.4) -> List[Dict]:
-        """Perform hybrid search combining vector and BM25 results"""
+    def vector_ranked(self, index: IndexSnapshot, query: str, top_k: int, backend: str = None,
+                      allowed: np.ndarray = None) -> (np.ndarray, np.ndarray):
+        """Top-k doc indices and boosted cosine scores, best first"""
+        with metrics.stage("embed_query"):
+            query_vector = self.embed_query(query)
+        with metrics.stage("vector_index"):
+            vector_index = self.get_vector_index(index, backend)
+            return vector_index.search(query_vector, top_k, index.vector_priority_boost, allowed=allowed)
+    
+    def hybrid_search(self, query: str, top_k: int = 10, vector_weight: float = 0.6, bm25_weight: float = 0.4,
+                      index: IndexSnapshot = None, vector_backend: str = None, fusion: str = FUSION_MODE,
+                      filters: Dict[str, Any] = None) -> List[Dict]:
+        """Perform hybrid search combining vector and BM25 results.
+        
+        ``fusion`` picks how the two rankings are combined: "weighted" sums
+        max-normalised scores, "rrf" sums reciprocal ranks and "zscore" sums
+        standardised scores, each scaled by the retriever weights. Both
+        retrievers only score documents matching ``filters``.
+        """
+        # Both retrievers read the same snapshot even if a reload lands in between
+        index = index or self.index
+        if not self.models_ready.is_set():
+            # Fast start: keyword-only results until embeddings are ready
+            metrics.increment("rag_fallbacks_total", kind="hybrid_warm_up_bm25")
+            return [dict(result, search_type='bm25_fallback')
+                    for result in self.bm25_search(query, top_k, index=index, filters=filters)]
+        if fusion not in FUSION_MODES:
+            raise ValueError(f"Unknown fusion mode '{fusion}', expected one of {FUSION_MODES}")
+        allowed = index.filter_mask(parse_filters(filters))
         try:
-            # Get results from both search methods
-            vector_results = self.vector_search(query, top_k * 2)  # Get more results for better fusion
-            bm25_results = self.bm25_search(query, top_k * 2)
-            
-            # Normalize scores to [0, 1] range
-            if vector_results:
-                max_vector_score = max(r['score'] for r in vector_results)
-                if max_vector_score > 0:
-                    for result in vector_results:
-                        result['normalized_score'] = result['score'] / max_vector_score
-                else:
-                    for result in vector_results:
-                        result['normalized_score'] = 0
-            
-            if bm25_results:
-                max_bm25_score = max(r['score'] for r in bm25_results)
-                if max_bm25_score > 0:
-                    for result in bm25_results:
-                        result['normalized_score'] = result['score'] / max_bm25_score
-                else:
-                    for result in bm25_results:
-                        result['normalized_score'] = 0
+            # Get more results than requested from both retrievers for better fusion
+            # The copied context carries the request's timing trace into the pool thread
+            vector_future = self.retriever_pool.submit(contextvars.copy_context().run, self.vector_ranked, index, query,
+                                                       top_k * 2, vector_backend, allowed) \
+                if self.retriever_pool is not None else None
+            bm25_ids, bm25_scores = self.bm25_ranked(index, query, top_k * 2, allowed=allowed)
             
-            # Combine results
-            combined_scores = {}
+            try:
+                vector_ids, vector_scores = vector_future.result() if vector_future is not None else \
+                    self.vector_ranked(index, query, top_k * 2, vector_backend, allowed)
+            except Exception as e:
+                self.record_search_error("vector_search", e)
+                metrics.increment("rag_fallbacks_total", kind="hybrid_bm25_only")
+                vector_ids, vector_scores = np.zeros(0, dtype=np.int64), np.zeros(0)
             
-            # Add vector results
-            for result in vector_results:
-                doc_id = result['document']['id']
-                combined_scores[doc_id] = {
-                    'document': result['document'],
-                    'vector_score': result['normalized_score'],
-                    'bm25_score': 0.0,
-                    'search_type': 'vector'
+            with metrics.stage("fusion"):
+                doc_ids, scores, vector_parts, bm25_parts, found = fuse_rankings(
+                    vector_ids, vector_scores, bm25_ids, bm25_scores, top_k, vector_weight, bm25_weight, fusion
+                )
+            search_types = {1: 'vector', 2: 'bm25', 3: 'hybrid'}
+            return [
+                {
+                    'document': index.knowledge_base[doc_ids[i]],
+                    'score': float(scores[i]),
+                    'vector_score': float(vector_parts[i]),
+                    'bm25_score': float(bm25_parts[i]),
+                    'search_type': search_types[int(found[i])]
                 }
-            
-            # Add BM25 results
-            for result in bm25_results:
-                doc_id = result['document']['id']
-                if doc_id in combined_scores:
-                    combined_scores[doc_id]['bm25_score'] = result['normalized_score']
-                    combined_scores[doc_id]['search_type'] = 'hybrid'
-                else:
-                    combined_scores[doc_id] = {
-                        'document': result['document'],
-                        'vector_score': 0.0,
-                        'bm25_score': result['normalized_score'],
-                        'search_type': 'bm25'
-                    }
-            
-            # Calculate final hybrid scores
-            final_results = []
-            for doc_id, data in combined_scores.items():
-                hybrid_score = (vector_weight * data['vector_score']) + (bm25_weight * data['bm25_score'])
-                final_results.append({
-                    'document': data['document'],
-                    'score': hybrid_score,
-                    'vector_score': data['vector_score'],
-                    'bm25_score': data['bm25_score'],
-                    'search_type': data['search_type']
-                })
-            
-            # Sort by hybrid score and return top_k
-            final_results.sort(key=lambda x: x['score'], reverse=True)
-            return final_results[:top_k]
+                for i in range(len(doc_ids))
+            ]
             
         except Exception as e:
-            print(f"Error in hybrid search: {e}")
+            self.record_search_error("hybrid_search", e)
+            metrics.increment("rag_fallbacks_total", kind="hybrid_vector_only")
             # Fallback to vector search only
-            return self.vector_search(query, top_k)
+            return self.vector_search(query, top_k, index=index, backend=vector_backend, filters=filters)
+    
+    def search_knowledge_base(self, query: str, top_k: int = 5, search_type: str = "hybrid",
+                              vector_weight: float = 0.6, bm25_weight: float = 0.4, vector_backend: str = None,
+                              fusion: str = FUSION_MODE, filters: Dict[str, Any] = None) -> List[Dict]:
+        """Search the knowledge base using specified method, serving repeats from the result cache"""
+        index = self.index
+        filters = parse_filters(filters)
+        vector_backend = vector_backend or self.vector_backend
+        weights = (round(vector_weight, 6), round(bm25_weight, 6), fusion) if search_type == "hybrid" else None
+        backend = vector_backend if search_type != "bm25" else None
+        # Warm-up fallbacks must not outlive the warm-up, even when the snapshot stays the same
+        ready = self.models_ready.is_set()
+        filter_key = json.dumps(filters, sort_keys=True) if filters else None
+        key = (index.version, ready, self.normalize_query(query), top_k, search_type, weights, backend, filter_key)
+        with metrics.stage("result_cache"):
+            results = self.result_cache.get(key)
+        if results is None:
+            failures = []
+            token = self.search_failures.set(failures)
+            try:
+                if search_type == "vector":
+                    results = self.vector_search(query, top_k, index=index, backend=vector_backend, filters=filters)
+                elif search_type == "bm25":
+                    results = self.bm25_search(query, top_k, index=index, filters=filters)
+                else:  # hybrid
+                    results = self.hybrid_search(query, top_k, vector_weight, bm25_weight, index=index,
+                                                 vector_backend=vector_backend, fusion=fusion, filters=filters)
+            finally:
+                self.search_failures.reset(token)
+            # A retriever error degrades this answer only; the next request tries again
+            if not failures:
+                self.result_cache.put(key, results)
+        return list(results)
     
-    def search_knowledge_base(self, query: str, top_k: int = 5, search_type: str = "hybrid") -> List[Dict]:
-        """Search the knowledge base using specified method"""
-        if search_type == "vector":
-            return self.vector_search(query, top_k)
-        elif search_type == "bm25":
-            return self.bm25_search(query, top_k)
-        else:  # hybrid
-            return self.hybrid_search(query, top_k)
+    def record_search_error(self, component: str, error: Exception):
+        """Log and count a retriever error, and keep the current request's results out of the cache"""
+        print(f"Error in {component.replace('_', ' ')}: {error}")
+        metrics.increment("rag_errors_total", component=component)
+        failures = self.search_failures.get()
+        if failures is not None:
+            failures.append(component)
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Counters for the query embedding and result caches"""
+        return {
+            "index_version": self.index_version,
+            "query_embeddings": self.query_embedding_cache.stats(),
+            "results": self.result_cache.stats()
+        }
+    
+    def get_vector_index_stats(self) -> Dict[str, Any]:
+        """Default backend and the vector indexes built for the published snapshot"""
+        embeddings = self.index.embeddings
+        return {
+            "embedding_storage": EMBEDDING_STORAGE,
+            "full_precision_bytes_in_memory": 0 if isinstance(embeddings, np.memmap) else int(embeddings.nbytes),
+            "default_backend": self.vector_backend,
+            "available_backends": list(VECTOR_INDEX_BACKENDS),
+            "built": {name: vector_index.stats() for name, vector_index in self.index.vector_indexes.items()}
+        }
+    
+    def get_inference_stats(self) -> Dict[str, Any]:
+        """Embedding inference backend, its thread settings and the ONNX parity report"""
+        return {
+            "backend": self.inference_backend,
+            "requested_backend": self.requested_inference_backend,
+            "device": self.device,
+            "onnx_model": self.onnx_encoder.path if self.onnx_encoder is not None else None,
+            "intra_op_threads": INTRA_OP_THREADS,
+            "inter_op_threads": INTER_OP_THREADS,
+            "parity": self.inference_parity
+        }
 
 # Initialize the bot
 print("Initializing Hybrid Search RAGtim Bot...")
 bot = HybridSearchRAGBot()
+if WATCH_INTERVAL > 0 and bot.serving_role == "primary":
+    bot.start_watcher(WATCH_INTERVAL)
 
 # API Functions for Gradio Client
-def search_api(query: str, top_k: int = 5, search_type: str = "hybrid", vector_weight: float = 0.6, bm25_weight: float = 0.4):
-    """API endpoint for hybrid search functionality"""
+SEARCH_TYPES = ("hybrid", "vector", "bm25")
+
+def search_api(query: str, top_k: int = 5, search_type: str = "hybrid", vector_weight: float = 0.6, bm25_weight: float = 0.4,
+               batch: bool = False, vector_backend: str = None, fusion: str = FUSION_MODE, projection: str = "full",
+               snippet_chars: int = 200, filters=None, timings: bool = False):
+    """API endpoint for hybrid search functionality.
+    
+    With ``batch`` set, ``query`` holds one query per line (or is a list of
+    queries) and ``results`` holds one result list per query. ``projection``
+    trims each result's document: "full" (default), "snippet" (metadata and
+    the first ``snippet_chars`` characters) or "ids". ``filters`` (a dict or
+    JSON object) restricts results by type, source and priority range, e.g.
+    ``{"type": ["publications"], "min_priority": 8}``. With ``timings`` set
+    the response includes a per-stage latency breakdown.
+    """
+    start_time = time.perf_counter()
     try:
-        if search_type == "hybrid":
-            results = bot.hybrid_search(query, top_k, vector_weight, bm25_weight)
-        else:
-            results = bot.search_knowledge_base(query, top_k, search_type)
+        top_k = int(top_k)
+        snippet_chars = int(snippet_chars)
+        filters = parse_filters(filters)
         
-        return {
+        with metrics.trace() as trace:
+            if batch:
+                queries = query if isinstance(query, list) else [q.strip() for q in query.split('\n') if q.strip()]
+                if search_type == "bm25":
+                    results = bot.bm25_search_batch(queries, top_k, filters=filters)
+                else:
+                    results = [bot.search_knowledge_base(q, top_k, search_type, vector_weight, bm25_weight,
+                                                         vector_backend, fusion, filters) for q in queries]
+            else:
+                results = bot.search_knowledge_base(query, top_k, search_type, vector_weight, bm25_weight,
+                                                    vector_backend, fusion, filters)
+            
+            with metrics.stage("projection"):
+                if batch:
+                    results = [project_results(query_results, projection, snippet_chars) for query_results in results]
+                else:
+                    results = project_results(results, projection, snippet_chars)
+            
+            if timings:
+                # Gradio serialises the response again; this measures what that costs
+                with metrics.stage("serialize"):
+                    json.dumps(results)
+        
+        response = {
             "results": results,
-            "query": query,
+            "query": queries if batch else query,
+            "batch": batch,
             "top_k": top_k,
             "search_type": search_type,
             "total_documents": len(bot.knowledge_base),
+            "index_status": bot.status,
             "search_parameters": {
                 "vector_weight": vector_weight if search_type == "hybrid" else None,
                 "bm25_weight": bm25_weight if search_type == "hybrid" else None,
+                "fusion": fusion if search_type == "hybrid" else None,
+                "projection": projection,
+                "filters": filters,
+                "vector_backend": (vector_backend or bot.vector_backend) if search_type != "bm25" else None,
                 "bm25_k1": bot.k1,
                 "bm25_b": bot.b
             }
         }
+        if timings:
+            response["timings"] = {
+                "stages_ms": {stage: round(milliseconds, 3) for stage, milliseconds in trace.items()},
+                "total_ms": round((time.perf_counter() - start_time) * 1000, 3)
+            }
+        return response
     except Exception as e:
         print(f"Error in search API: {e}")
+        metrics.increment("rag_errors_total", component="search_api")
         return {"error": str(e), "results": []}
+    finally:
+        # Label values come from the request; unknown ones share one series so they cannot grow the registry
+        metrics.observe("rag_request_duration_seconds", time.perf_counter() - start_time, endpoint="search_api",
+                        search_type=search_type if search_type in SEARCH_TYPES else "other")
 
 def get_stats_api():
     """API endpoint for knowledge base statistics"""
@@ -417,10 +3283,7 @@ def get_stats_api():
         doc_types = {}
         sections_by_file = {}
         
-        for doc in bot.knowledge_base:
-            doc_type = doc["metadata"]["type"]
-            source_file = doc["metadata"]["source"]
-            
+        for doc_type, source_file in zip(bot.knowledge_base.types, bot.knowledge_base.sources):
             doc_types[doc_type] = doc_types.get(doc_type, 0) + 1
             sections_by_file[source_file] = sections_by_file.get(source_file, 0) + 1
         
@@ -428,8 +3291,8 @@ def get_stats_api():
             "total_documents": len(bot.knowledge_base),
             "document_types": doc_types,
             "sections_by_file": sections_by_file,
-            "model_name": "sentence-transformers/all-MiniLM-L6-v2",
-            "embedding_dimension": 384,
+            "model_name": bot.model_name,
+            "embedding_dimension": EMBEDDING_DIM,
             "search_capabilities": [
                 "Hybrid Search (Vector + BM25)",
                 "Semantic Vector Search", 
@@ -445,10 +3308,19 @@ def get_stats_api():
             },
             "backend_type": "Hugging Face Space with Hybrid Search",
             "knowledge_sources": list(sections_by_file.keys()),
-            "status": "healthy"
+            "cache": bot.get_cache_stats(),
+            "vector_index": bot.get_vector_index_stats(),
+            "inference": bot.get_inference_stats(),
+            "query_batching": bot.query_batcher.stats() if bot.query_batcher is not None else {"enabled": False},
+            "readiness": bot.get_readiness(),
+            "chat": get_chat_timing_stats(),
+            "metrics": metrics.stats(),
+            "serving": bot.get_serving_stats(),
+            "status": "healthy" if bot.models_ready.is_set() else "warming_up" if bot.status != "error" else "degraded"
         }
     except Exception as e:
         print(f"Error in get_stats_api: {e}")
+        metrics.increment("rag_errors_total", component="get_stats_api")
         return {
             "error": str(e),
             "status": "error",
@@ -456,64 +3328,121 @@ def get_stats_api():
             "search_capabilities": ["Error"]
         }
 
-def chat_interface(message: str) -> str:
-    """Simple chat interface without state management"""
+def get_metrics_text() -> str:
+    """Prometheus text exposition of the latency histograms, counters and index gauges (served at /metrics)"""
+    result_cache = bot.result_cache.stats()
+    query_cache = bot.query_embedding_cache.stats()
+    return metrics.prometheus_text({
+        "rag_index_version": bot.index_version,
+        "rag_index_documents": len(bot.knowledge_base),
+        "rag_models_ready": int(bot.models_ready.is_set()),
+        "rag_shared_generation": bot.shared_generation,
+        "rag_result_cache_hits": result_cache["hits"],
+        "rag_result_cache_misses": result_cache["misses"],
+        "rag_query_embedding_cache_hits": query_cache["hits"],
+        "rag_query_embedding_cache_misses": query_cache["misses"]
+    })
+
+def metrics_route():
+    from fastapi.responses import PlainTextResponse
+    return PlainTextResponse(get_metrics_text(), media_type="text/plain; version=0.0.4")
+
+# Chat latency: time to the first streamed chunk vs. time to the complete response
+def record_chat_timing(first_chunk_seconds: float, total_seconds: float):
+    metrics.observe("rag_request_duration_seconds", first_chunk_seconds, endpoint="chat_first_chunk")
+    metrics.observe("rag_request_duration_seconds", total_seconds, endpoint="chat")
+
+def get_chat_timing_stats() -> Dict[str, Any]:
+    first_chunk = metrics.histogram("rag_request_duration_seconds", endpoint="chat_first_chunk").stats()
+    total = metrics.histogram("rag_request_duration_seconds", endpoint="chat").stats()
+    return {
+        "requests": total["count"],
+        "avg_time_to_first_token_ms": first_chunk.get("mean_ms"),
+        "avg_total_ms": total.get("mean_ms"),
+        "last_time_to_first_token_ms": first_chunk.get("last_ms"),
+        "last_total_ms": total.get("last_ms"),
+        "time_to_first_token": first_chunk,
+        "total": total
+    }
+
+def chat_interface_stream(message: str):
+    """Streaming chat: yields the response so far, starting with the top hit as soon as retrieval finishes"""
     if not message.strip():
-        return "Please ask me something about Raktim Mondol! I use hybrid search combining semantic similarity and keyword matching for the best results."
+        yield "Please ask me something about Raktim Mondol! I use hybrid search combining semantic similarity and keyword matching for the best results."
+        return
     
+    start_time = time.perf_counter()
+    first_chunk_time = None
     try:
         # Use hybrid search by default
-        search_results = bot.hybrid_search(message, top_k=6)
+        search_results = bot.search_knowledge_base(message, top_k=6)
         
-        if search_results:
-            # Build comprehensive response
-            response_parts = []
-            response_parts.append(f"🔍 **Hybrid Search Results** (Vector + BM25 combination, found {len(search_results)} relevant sections):\n")
-            
-            # Use the best match as primary response
-            best_match = search_results[0]
-            response_parts.append(f"**Primary Answer** (Hybrid Score: {best_match['score']:.3f}):")
-            response_parts.append(f"📄 Source: {best_match['document']['metadata']['source']} - {best_match['document']['metadata']['section']}")
-            response_parts.append(f"🔍 Search Type: {best_match['search_type'].upper()}")
-            
-            # Show score breakdown for hybrid results
-            if 'vector_score' in best_match and 'bm25_score' in best_match:
-                response_parts.append(f"📊 Vector Score: {best_match['vector_score']:.3f} | BM25 Score: {best_match['bm25_score']:.3f}")
-            
-            response_parts.append(f"\n{best_match['document']['content']}\n")
-            
-            # Add additional context if available
-            if len(search_results) > 1:
-                response_parts.append("**Additional Context:**")
-                for i, result in enumerate(search_results[1:3], 1):  # Show up to 2 additional results
-                    section_info = f"{result['document']['metadata']['source']} - {result['document']['metadata']['section']}"
-                    search_info = f"({result['search_type'].upper()}, Score: {result['score']:.3f})"
-                    response_parts.append(f"{i}. {section_info} {search_info}")
-                    
-                    # Add a brief excerpt
-                    excerpt = result['document']['content'][:200] + "..." if len(result['document']['content']) > 200 else result['document']['content']
-                    response_parts.append(f"   {excerpt}\n")
-            
-            response_parts.append("\n🤖 **Hybrid Search Technology:**")
-            response_parts.append("• **Vector Search**: Semantic similarity using transformer embeddings")
-            response_parts.append("• **BM25 Search**: Advanced keyword ranking with TF-IDF")
-            response_parts.append("• **Fusion**: Weighted combination for optimal relevance")
-            response_parts.append("\n[Note: This demonstrates hybrid search results. In production, these would be passed to an LLM for natural response generation.]")
-            
-            return "\n".join(response_parts)
-        else:
-            return "I don't have specific information about that topic in my knowledge base. Could you please ask something else about Raktim Mondol?"
+        if not search_results:
+            first_chunk_time = time.perf_counter()
+            yield "I don't have specific information about that topic in my knowledge base. Could you please ask something else about Raktim Mondol?"
+            return
+        
+        # Use the best match as primary response, sent on its own
+        best_match = search_results[0]
+        response_parts = [
+            f"🔍 **Hybrid Search Results** (Vector + BM25 combination, found {len(search_results)} relevant sections):\n",
+            f"**Primary Answer** (Hybrid Score: {best_match['score']:.3f}):",
+            f"📄 Source: {best_match['document']['metadata']['source']} - {best_match['document']['metadata']['section']}",
+            f"🔍 Search Type: {best_match['search_type'].upper()}"
+        ]
+        
+        # Show score breakdown for hybrid results
+        if 'vector_score' in best_match and 'bm25_score' in best_match:
+            response_parts.append(f"📊 Vector Score: {best_match['vector_score']:.3f} | BM25 Score: {best_match['bm25_score']:.3f}")
+        
+        response_parts.append(f"\n{best_match['document']['content']}\n")
+        response = "\n".join(response_parts)
+        first_chunk_time = time.perf_counter()
+        yield response
+        
+        # Then stream additional context, one result at a time
+        if len(search_results) > 1:
+            response += "\n**Additional Context:**"
+            for i, result in enumerate(search_results[1:3], 1):  # Show up to 2 additional results
+                section_info = f"{result['document']['metadata']['source']} - {result['document']['metadata']['section']}"
+                search_info = f"({result['search_type'].upper()}, Score: {result['score']:.3f})"
+                
+                # Add a brief excerpt
+                excerpt = result['document']['content'][:200] + "..." if len(result['document']['content']) > 200 else result['document']['content']
+                response += f"\n{i}. {section_info} {search_info}\n   {excerpt}\n"
+                yield response
+        
+        response += "\n".join([
+            "",
+            "\n🤖 **Hybrid Search Technology:**",
+            "• **Vector Search**: Semantic similarity using transformer embeddings",
+            "• **BM25 Search**: Advanced keyword ranking with TF-IDF",
+            "• **Fusion**: Weighted combination for optimal relevance",
+            "\n[Note: This demonstrates hybrid search results. In production, these would be passed to an LLM for natural response generation.]"
+        ])
+        yield response
         
     except Exception as e:
         print(f"Error in chat interface: {e}")
-        return "I'm sorry, I encountered an error while processing your question. Please try again."
+        metrics.increment("rag_errors_total", component="chat")
+        yield "I'm sorry, I encountered an error while processing your question. Please try again."
+    finally:
+        if first_chunk_time is not None:
+            record_chat_timing(first_chunk_time - start_time, time.perf_counter() - start_time)
+
+def chat_interface(message: str) -> str:
+    """Simple chat interface without state management"""
+    response = ""
+    for response in chat_interface_stream(message):
+        pass
+    return response
 
 # Create Gradio interfaces with proper API names
 print("Creating Gradio interface...")
 
 # Main chat interface - simplified without state
 chat_demo = gr.Interface(
-    fn=chat_interface,
+    fn=chat_interface_stream,
     inputs=gr.Textbox(
         label="Ask about Raktim Mondol", 
         placeholder="What would you like to know about Raktim's research, skills, or experience?",
@@ -541,7 +3470,7 @@ chat_demo = gr.Interface(
         "What are his multimodal AI capabilities?",
         "Describe his biostatistics expertise"
     ],
-    api_name="chat"
+    api_name="chat_stream"
 )
 
 # Search API interface
@@ -550,9 +3479,16 @@ search_demo = gr.Interface(
     inputs=[
         gr.Textbox(label="Search Query", placeholder="Enter your search query"),
         gr.Number(label="Top K Results", value=5, minimum=1, maximum=20),
-        gr.Radio(choices=["hybrid", "vector", "bm25"], value="hybrid", label="Search Type"),
+        gr.Radio(choices=list(SEARCH_TYPES), value="hybrid", label="Search Type"),
         gr.Slider(minimum=0.0, maximum=1.0, value=0.6, label="Vector Weight"),
-        gr.Slider(minimum=0.0, maximum=1.0, value=0.4, label="BM25 Weight")
+        gr.Slider(minimum=0.0, maximum=1.0, value=0.4, label="BM25 Weight"),
+        gr.Checkbox(value=False, label="Batch (one query per line)"),
+        gr.Radio(choices=list(VECTOR_INDEX_BACKENDS), value=bot.vector_backend, label="Vector Backend"),
+        gr.Radio(choices=list(FUSION_MODES), value=FUSION_MODE, label="Fusion"),
+        gr.Radio(choices=list(RESULT_PROJECTIONS), value="full", label="Result Projection"),
+        gr.Number(label="Snippet Characters", value=200, minimum=0),
+        gr.Textbox(label="Filters (JSON)", placeholder='{"type": ["publications"], "min_priority": 8}'),
+        gr.Checkbox(value=False, label="Timing breakdown")
     ],
     outputs=gr.JSON(label="Search Results"),
     title="🔍 Hybrid Search API",
@@ -577,17 +3513,108 @@ demo = gr.TabbedInterface(
     title="🔥 Hybrid Search RAGtim Bot - Vector + BM25 Fusion"
 )
 
+# The chat tab streams via /chat_stream; API clients that expect one complete answer keep /chat
+with demo:
+    gr.api(chat_interface, api_name="chat")
+
+def benchmark_analyzer(repeats: int = 20) -> Dict[str, Any]:
+    """Indexing throughput and per-query tokenization cost of the BM25 analyzer on the loaded corpus"""
+    documents = list(bot.knowledge_base.contents) * repeats
+    words = sum(len(TextAnalyzer.WORD_PATTERN.findall(text)) for text in documents)
+    queries = list(bot.knowledge_base.sections) or ["deep learning research"]
+    
+    # A fresh analyzer pays for vocabulary growth and word memoisation like a cold build
+    analyzer = TextAnalyzer(stemming=bot.analyzer.stemming)
+    start_time = time.perf_counter()
+    for text in documents:
+        analyzer.term_ids(text, add=True)
+    index_seconds = time.perf_counter() - start_time
+    
+    start_time = time.perf_counter()
+    for _ in range(repeats):
+        for query in queries:
+            analyzer.term_ids(query)
+    query_seconds = time.perf_counter() - start_time
+    
+    start_time = time.perf_counter()
+    for _ in range(max(1, repeats // 10)):
+        bot.build_bm25_index(bot.index.copy_documents())
+    build_seconds = (time.perf_counter() - start_time) / max(1, repeats // 10)
+    
+    return {
+        "analyzer": analyzer.config,
+        "documents": len(documents),
+        "vocabulary_size": len(analyzer.terms),
+        "index_documents_per_second": len(documents) / index_seconds if index_seconds else 0.0,
+        "index_words_per_second": words / index_seconds if index_seconds else 0.0,
+        "query_tokenization_microseconds": query_seconds / (repeats * len(queries)) * 1e6,
+        "bm25_index_build_seconds": build_seconds
+    }
+
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Hybrid Search RAGtim Bot")
+    parser.add_argument("--warm-cache", action="store_true", help="fill the embedding cache for the current markdown files and exit")
+    parser.add_argument("--rebuild-cache", action="store_true", help="drop the embedding cache, re-embed every section and exit")
+    parser.add_argument("--build-index", metavar="PATH", help="write a prebuilt index artifact (e.g. index.ragidx) for RAG_INDEX_ARTIFACT and exit")
+    parser.add_argument("--benchmark-analyzer", action="store_true", help="print BM25 analyzer indexing and query tokenization throughput as JSON and exit")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="also start N worker processes on the following ports, serving the index this process shares in RAG_SHARED_INDEX_DIR")
+    args = parser.parse_args()
+    if args.workers > 0 and (bot.shared_index is None or bot.serving_role != "primary"):
+        parser.error("--workers needs RAG_SHARED_INDEX_DIR and must be run from the primary process")
+    
+    if args.build_index or args.warm_cache or args.rebuild_cache:
+        # Offline commands need the embeddings, so let a fast-start warm-up finish first
+        bot.startup_finished.wait()
+        if bot.status == "error":
+            print(f"❌ Embedding model failed to load, cannot run offline commands: {bot.startup_error}")
+            sys.exit(1)
+    
+    if args.build_index:
+        bot.save_index_artifact(args.build_index)
+        sys.exit(0)
+    
+    if args.benchmark_analyzer:
+        print(json.dumps(benchmark_analyzer(), indent=2))
+        sys.exit(0)
+    
+    if args.rebuild_cache and bot.embedding_cache is not None:
+        print("Rebuilding embedding cache...")
+        bot.embedding_cache.clear()
+        bot.load_markdown_knowledge_base()
+    if args.warm_cache or args.rebuild_cache:
+        cached = len(bot.embedding_cache) if bot.embedding_cache is not None else 0
+        print(f"✅ Embedding cache holds {cached} sections")
+        sys.exit(0)
+    
     print("🚀 Launching Hybrid Search RAGtim Bot...")
     print(f"📚 Loaded {len(bot.knowledge_base)} sections from markdown files")
     print(f"🔍 BM25 index: {len(bot.document_frequency)} unique terms")
-    print(f"🧠 Vector embeddings: {len(bot.embeddings)} documents")
-    print("🔥 Hybrid search ready: Semantic + Keyword fusion!")
+    if bot.models_ready.is_set():
+        print(f"🧠 Vector embeddings: {len(bot.embeddings)} documents")
+        print("🔥 Hybrid search ready: Semantic + Keyword fusion!")
+    else:
+        print("⏳ Fast start: serving BM25 search while the embedding model loads in the background")
+    
+    # Workers map the generation this process already published; each loads only its own model
+    if args.workers > 0:
+        import atexit
+        import subprocess
+        workers = []
+        for number in range(1, args.workers + 1):
+            env = dict(os.environ, RAG_SERVING_ROLE="worker", RAG_SERVER_PORT=str(SERVER_PORT + number),
+                       RAG_SHARED_INDEX_DIR=bot.shared_index.directory, RAG_WATCH_INTERVAL="0")
+            workers.append(subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=env))
+        atexit.register(lambda: [worker.terminate() for worker in workers])
+        print(f"👥 Started {args.workers} workers on ports {SERVER_PORT + 1}-{SERVER_PORT + args.workers}")
     
-    # Launch the main demo with API access
+    # Launch the main demo with API access, plus a plain-text /metrics route for Prometheus
+    from fastapi.routing import APIRoute
     demo.launch(
         server_name="0.0.0.0",
-        server_port=7860,
+        server_port=SERVER_PORT,
         share=False,
-        show_error=True
+        show_error=True,
+        app_kwargs={"routes": [APIRoute("/metrics", metrics_route, methods=["GET"])]}
     )
\ No newline at end of file
@@ -0,0 +1,274 @@
+"""Retrieval benchmark for HybridSearchRAGBot over synthetic markdown corpora.
+
+    python benchmark.py                                  # 10^2, 10^4 and 10^5 sections, stub embedder
+    python benchmark.py --sizes 100 1000 --embedder model --output before.json
+
+Each corpus size runs in a fresh interpreter, so cold start and peak RSS
+are not polluted by earlier sizes. Corpora and queries are generated from
+a fixed seed, so two runs (e.g. before and after a change) search the
+same text with the same queries. Results are written as JSON.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any
+
+import numpy as np
+
+DEFAULT_SIZES = [100, 10000, 100000]
+SEARCH_TYPES = ["bm25", "vector", "hybrid"]
+SECTIONS_PER_FILE = 100
+VOCABULARY_SIZE = 5000
+SYLLABLES = ["ka", "lo", "mi", "ne", "ra", "tu", "vi", "so", "de", "pa", "xi", "gu", "be", "ze", "fo", "qua"]
+
+def make_vocabulary(seed: int) -> List[str]:
+    """Distinct pseudo-words of 2-4 syllables"""
+    rng = np.random.default_rng(seed)
+    words = set()
+    while len(words) < VOCABULARY_SIZE:
+        words.add("".join(rng.choice(SYLLABLES, size=rng.integers(2, 5))))
+    return sorted(words)
+
+def zipf_weights(size: int) -> np.ndarray:
+    weights = 1.0 / np.arange(1, size + 1)
+    return weights / weights.sum()
+
+def write_corpus(directory: str, sections: int, seed: int) -> List[str]:
+    """Write ``sections`` markdown sections, SECTIONS_PER_FILE per file, with Zipf-distributed words"""
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array(make_vocabulary(seed))
+    cdf = np.cumsum(zipf_weights(len(vocabulary)))
+    files = []
+    for file_number, start in enumerate(range(0, sections, SECTIONS_PER_FILE)):
+        count = min(SECTIONS_PER_FILE, sections - start)
+        lines = [f"# Synthetic document {file_number}\n"]
+        for section in range(start, start + count):
+            title = " ".join(rng.choice(vocabulary[:500], size=3))
+            lines.append(f"\n## {title} {section}\n")
+            for _ in range(rng.integers(3, 7)):
+                # Inverse-CDF sampling: much faster than rng.choice with p for many small draws
+                ranks = np.minimum(np.searchsorted(cdf, rng.random(rng.integers(8, 16))), len(vocabulary) - 1)
+                words = vocabulary[ranks]
+                lines.append(" ".join(words).capitalize() + ".\n")
+        path = os.path.join(directory, f"corpus_{file_number:05d}.md")
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+        files.append(path)
+    return files
+
+def make_queries(count: int, seed: int) -> List[str]:
+    """Fixed query set of 2-4 mid-frequency words, independent of corpus size"""
+    rng = np.random.default_rng(seed + 1)
+    vocabulary = make_vocabulary(seed)[:2000]
+    return [" ".join(rng.choice(vocabulary, size=rng.integers(2, 5))) for _ in range(count)]
+
+def latency_summary(seconds: List[float]) -> Dict[str, float]:
+    milliseconds = np.array(seconds) * 1000
+    return {
+        "count": len(milliseconds),
+        "mean_ms": float(milliseconds.mean()),
+        "p50_ms": float(np.percentile(milliseconds, 50)),
+        "p95_ms": float(np.percentile(milliseconds, 95)),
+        "p99_ms": float(np.percentile(milliseconds, 99)),
+        "max_ms": float(milliseconds.max())
+    }
+
+def peak_rss_mb() -> float:
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def run_size(sections: int, args) -> Dict[str, Any]:
+    """Benchmark one corpus size in this process"""
+    # The module builds its own bot on import; keep it model-free and cache-free too
+    os.environ["RAG_INFERENCE_BACKEND"] = "stub" if args.embedder == "stub" else os.environ.get("RAG_INFERENCE_BACKEND", "torch")
+    os.environ["RAG_EMBEDDING_CACHE_DIR"] = ""
+    os.environ["RAG_FAST_START"] = "0"
+    os.environ["RAG_WATCH_INTERVAL"] = "0"
+    os.environ.pop("RAG_INDEX_ARTIFACT", None)
+    import app
+    baseline_rss = peak_rss_mb()
+    
+    workspace = tempfile.mkdtemp(prefix="rag_benchmark_")
+    try:
+        corpus_dir = os.path.join(workspace, "corpus")
+        os.makedirs(corpus_dir)
+        start_time = time.perf_counter()
+        files = write_corpus(corpus_dir, sections, args.seed)
+        generate_seconds = time.perf_counter() - start_time
+        queries = make_queries(args.queries, args.seed)
+        bot_options = dict(markdown_files=[], markdown_directories=[corpus_dir], embedding_cache_dir=None,
+                           fast_start=False, inference_backend=os.environ["RAG_INFERENCE_BACKEND"])
+        
+        # Cold start: parse, chunk, embed and index from markdown
+        start_time = time.perf_counter()
+        bot = app.HybridSearchRAGBot(index_artifact="", **bot_options)
+        cold_start_seconds = time.perf_counter() - start_time
+        startup_timings = dict(bot.startup_timings)
+        
+        # Full rebuild in a warm process, and the BM25 part of it on its own
+        start_time = time.perf_counter()
+        bot.load_markdown_knowledge_base()
+        build_seconds = time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        bot.build_bm25_index(bot.index.copy_documents())
+        bm25_build_seconds = time.perf_counter() - start_time
+        
+        # Cold start from a prebuilt index artifact
+        artifact_path = os.path.join(workspace, "index.ragidx")
+        bot.save_index_artifact(artifact_path)
+        start_time = time.perf_counter()
+        app.HybridSearchRAGBot(index_artifact=artifact_path, **bot_options)
+        artifact_start_seconds = time.perf_counter() - start_time
+        
+        # Every query does the full work: no result or query embedding reuse
+        bot.result_cache = app.LRUCache(0)
+        bot.query_embedding_cache = app.LRUCache(0)
+        for query in queries[:10]:
+            for search_type in SEARCH_TYPES:
+                bot.search_knowledge_base(query, args.top_k, search_type)
+        
+        latency = {}
+        for search_type in SEARCH_TYPES:
+            samples = []
+            for query in queries:
+                start_time = time.perf_counter()
+                bot.search_knowledge_base(query, args.top_k, search_type)
+                samples.append(time.perf_counter() - start_time)
+            latency[search_type] = latency_summary(samples)
+        
+        throughput = {}
+        for clients in args.clients:
+            def timed_search(query: str) -> float:
+                start_time = time.perf_counter()
+                bot.search_knowledge_base(query, args.top_k, "hybrid")
+                return time.perf_counter() - start_time
+            
+            workload = queries * max(1, args.passes)
+            with ThreadPoolExecutor(max_workers=clients) as pool:
+                start_time = time.perf_counter()
+                samples = list(pool.map(timed_search, workload))
+                elapsed = time.perf_counter() - start_time
+            throughput[str(clients)] = {
+                "queries": len(workload),
+                "queries_per_second": len(workload) / elapsed if elapsed else 0.0,
+                "latency": latency_summary(samples)
+            }
+        
+        return {
+            "sections": sections,
+            "documents": len(bot.knowledge_base),
+            "files": len(files),
+            "unique_terms": len(bot.document_frequency),
+            "corpus_generation_seconds": generate_seconds,
+            "cold_start_seconds": cold_start_seconds,
+            "startup_timings": startup_timings,
+            "index_build_seconds": build_seconds,
+            "bm25_build_seconds": bm25_build_seconds,
+            "artifact_bytes": os.path.getsize(artifact_path),
+            "cold_start_from_artifact_seconds": artifact_start_seconds,
+            "latency": latency,
+            "hybrid_throughput_by_clients": throughput,
+            "settings": {
+                "inference_backend": bot.inference_backend,
+                "vector_backend": bot.vector_backend,
+                "bm25_max_score": bot.bm25_max_score,
+                "fusion": app.FUSION_MODE,
+                "parallel_retrieval": bot.retriever_pool is not None,
+                "batch_window_ms": app.BATCH_WINDOW_MS,
+                "build_workers": bot.build_workers
+            },
+            "baseline_rss_mb": baseline_rss,
+            "peak_rss_mb": peak_rss_mb()
+        }
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except Exception:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark HybridSearchRAGBot retrieval on synthetic corpora")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="corpus sizes in sections")
+    parser.add_argument("--queries", type=int, default=200, help="number of queries in the fixed query set")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16], help="concurrent client counts for throughput")
+    parser.add_argument("--passes", type=int, default=1, help="times each client workload repeats the query set")
+    parser.add_argument("--embedder", choices=["stub", "model"], default="stub",
+                        help="stub needs no model download; model uses RAG_EMBEDDING_MODEL and RAG_INFERENCE_BACKEND")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", metavar="PATH", help="write the JSON report here instead of stdout")
+    parser.add_argument("--worker", type=int, metavar="SECTIONS", help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.worker is not None:
+        result = run_size(args.worker, args)
+        with open(args.result_file, "w") as f:
+            json.dump(result, f)
+        return
+    
+    report = {
+        "benchmark": "retrieval",
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_commit": git_commit(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "rag_settings": {key: value for key, value in sorted(os.environ.items()) if key.startswith("RAG_")}
+        },
+        "config": {
+            "embedder": args.embedder,
+            "queries": args.queries,
+            "top_k": args.top_k,
+            "clients": args.clients,
+            "passes": args.passes,
+            "seed": args.seed,
+            "sections_per_file": SECTIONS_PER_FILE,
+            "vocabulary_size": VOCABULARY_SIZE
+        },
+        "results": []
+    }
+    
+    for sections in args.sizes:
+        print(f"Benchmarking {sections} sections...", file=sys.stderr)
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+            result_file = f.name
+        try:
+            # Worker output (build progress) goes to stderr so stdout stays pure JSON
+            command = [sys.executable, os.path.abspath(__file__), "--worker", str(sections), "--result-file", result_file]
+            for name in ("queries", "top_k", "passes", "seed", "embedder"):
+                command += [f"--{name.replace('_', '-')}", str(getattr(args, name))]
+            command += ["--clients"] + [str(clients) for clients in args.clients]
+            subprocess.run(command, check=True, stdout=sys.stderr, cwd=os.path.dirname(os.path.abspath(__file__)))
+            with open(result_file) as f:
+                result = json.load(f)
+        finally:
+            os.remove(result_file)
+        report["results"].append(result)
+        print(f"✅ {sections} sections: cold start {result['cold_start_seconds']:.2f}s, "
+              f"hybrid p95 {result['latency']['hybrid']['p95_ms']:.2f} ms, peak RSS {result['peak_rss_mb']:.0f} MB",
+              file=sys.stderr)
+    
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()